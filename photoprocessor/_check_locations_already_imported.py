@@ -1,16 +1,190 @@
 #!/usr/bin/env python3
 
 import argparse
+import gzip
+import hashlib
+import json
+import os
 import sys
-from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from sqlalchemy import text, select, table, column, func
 from sqlalchemy.orm import Session
-from typing import Set, Dict, Any
-from collections import defaultdict
+from array import array
+from typing import Set, Dict, Any, List, Tuple, Iterator
 
 # Import the models and session factory from your existing files
-from models import Owner, Location, MediaOwnership
+from models import Owner, Location, MediaOwnership, ensure_indexes
 from database import SessionLocal
 
+# With --cache, results of previous scans are kept here, per owner and scanned directory
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "photoprocessor")
+
+# Same extensions as CONFIG["MEDIA_EXTENSIONS"] in import_pipe.py; other files are never imported.
+MEDIA_EXTENSIONS = frozenset({
+    '.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.heic', '.webp', '.dng',
+    '.mp4', '.mov', '.avi', '.mkv', '.flv', '.wmv'
+})
+
+
+def _file_extension(filename: str) -> str:
+    """Returns the lower-cased extension of a filename, matching pathlib.Path.suffix semantics."""
+    dot_index = filename.rfind('.')
+    # A leading dot (e.g. '.nomedia') marks a hidden file and a trailing dot (e.g. 'file.') no extension
+    if not 0 < dot_index < len(filename) - 1:
+        return ".<no_extension>"
+    return filename[dot_index:].lower()
+
+
+def _scan_single_directory(directory: str, extensions: frozenset | None) -> Tuple[List[Tuple[str, str, str]], List[str]]:
+    """
+    Lists a single directory with os.scandir.
+    Returns a (path, parent_dir, extension) tuple for every file and the paths of all subdirectories.
+    If extensions is given, files with any other extension are skipped before they are stat-ed.
+    """
+    files = []
+    subdirs = []
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                try:
+                    # DirEntry caches the type from readdir, so no extra stat call is needed here
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                        continue
+                    extension = _file_extension(entry.name)
+                    if extensions is not None and extension not in extensions:
+                        continue
+                    if entry.is_file():
+                        files.append((entry.path, directory, extension))
+                except OSError:
+                    continue
+    except (PermissionError, FileNotFoundError, NotADirectoryError):
+        pass
+    return files, subdirs
+
+
+def walk_parallel(root: str, pool: ThreadPoolExecutor, extensions: frozenset | None = None) -> Iterator[Tuple[str, str, str]]:
+    """
+    Recursively yields all files below root, scanning each directory as a
+    separate task on the given thread pool. Files are yielded as soon as their
+    directory has been listed, so callers can consume them while the walk continues.
+    Yields (path, parent_dir, extension) tuples.
+    """
+    pending = {pool.submit(_scan_single_directory, root, extensions)}
+
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            dir_files, subdirs = future.result()
+            # Every discovered subdirectory becomes its own task
+            for subdir in subdirs:
+                pending.add(pool.submit(_scan_single_directory, subdir, extensions))
+            yield from dir_files
+
+
+def find_owner_paths_in_db(db: Session, owner_id: int, paths: List[str], batch_size: int = 5000) -> Set[str]:
+    """
+    Returns the subset of the given paths that have a Location owned by the owner.
+
+    The scanned paths are uploaded into a temporary table and joined against the
+    locations on the database side, so only matching paths are ever loaded into
+    Python, regardless of how many locations the owner has in total.
+    """
+    db.execute(text("CREATE TEMP TABLE IF NOT EXISTS scanned_paths (path TEXT PRIMARY KEY)"))
+    try:
+        insert_stmt = text("INSERT OR IGNORE INTO scanned_paths (path) VALUES (:path)")
+        for i in range(0, len(paths), batch_size):
+            db.execute(insert_stmt, [{"path": p} for p in paths[i:i + batch_size]])
+
+        scanned_paths = table("scanned_paths", column("path"))
+        stmt = (
+            select(Location.path)
+            .join(scanned_paths, scanned_paths.c.path == Location.path)
+            .join(MediaOwnership, MediaOwnership.location_id == Location.id)
+            .where(MediaOwnership.owner_id == owner_id)
+        )
+        # Stream the matches in chunks and fill the set incrementally
+        # instead of materializing every row first.
+        matched = db.execute(stmt, execution_options={"yield_per": 10000}).scalars()
+        return set(matched)
+    finally:
+        db.execute(text("DROP TABLE IF EXISTS scanned_paths"))
+
+
+def _owner_db_state(db: Session, owner_id: int) -> Tuple[int, int, int]:
+    """
+    Returns a cheap fingerprint of the owner's locations in the database.
+    Any import or deletion for the owner changes the count or the max ids.
+    """
+    row = db.execute(
+        select(
+            func.count(MediaOwnership.id),
+            func.max(MediaOwnership.id),
+            func.max(MediaOwnership.location_id),
+        ).where(MediaOwnership.owner_id == owner_id)
+    ).one()
+    return tuple(row)
+
+
+def _scan_cache_path(owner_id: int, root_abs: str) -> str:
+    """Returns the cache file used for this owner and scanned directory."""
+    root_key = hashlib.sha1(root_abs.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(CACHE_DIR, f"owner_{owner_id}_{root_key}.json.gz")
+
+
+def _load_scan_cache(cache_path: str) -> Dict[str, Any] | None:
+    """Loads a previous scan result, or None if there is no usable cache."""
+    try:
+        with gzip.open(cache_path, 'rt', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (OSError, EOFError, ValueError):
+        return None
+    if not isinstance(cache, dict):
+        return None
+    return {
+        "state": cache.get("state"),
+        "scanned": set(cache.get("scanned", ())),
+        "matched": set(cache.get("matched", ())),
+    }
+
+
+def _save_scan_cache(cache_path: str, state: Tuple[int, int, int], scanned: Set[str], matched: Set[str]):
+    """Stores the scan result together with the database fingerprint it is valid for."""
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with gzip.open(cache_path, 'wt', encoding='utf-8') as f:
+            json.dump({"state": list(state), "scanned": list(scanned), "matched": list(matched)}, f)
+    except OSError as e:
+        print(f"⚠️ Warning: Could not write scan cache '{cache_path}': {e}", file=sys.stderr)
+
+
+def match_owner_paths(db: Session, owner_id: int, root_abs: str, paths: List[str], use_cache: bool = False) -> Set[str]:
+    """
+    Returns the subset of the scanned paths that have a Location owned by the owner.
+
+    If the owner's locations are unchanged since the last scan of this directory,
+    the cached matches are reused and only newly appeared paths are sent to the database.
+    """
+    if not use_cache:
+        return find_owner_paths_in_db(db, owner_id, paths)
+
+    state = _owner_db_state(db, owner_id)
+    cache_path = _scan_cache_path(owner_id, root_abs)
+    cache = _load_scan_cache(cache_path)
+    scanned = set(paths)
+
+    if cache and cache["state"] == list(state):
+        new_paths = [p for p in paths if p not in cache["scanned"]]
+        print(f"♻️ Reusing cached results, querying {len(new_paths)} new paths.")
+        matched = {p for p in cache["matched"] if p in scanned}
+        if new_paths:
+            matched |= find_owner_paths_in_db(db, owner_id, new_paths)
+    else:
+        matched = find_owner_paths_in_db(db, owner_id, paths)
+
+    _save_scan_cache(cache_path, state, scanned, matched)
+    return matched
+
 
 def print_summary_report(results: Dict[str, Any], total_scanned: int, total_found: int, total_missing: int):
     """Prints a detailed, structured summary of the scan results."""
@@ -46,7 +220,8 @@ def print_summary_report(results: Dict[str, Any], total_scanned: int, total_foun
         print("-" * 20)
 
 
-def check_directory_for_owner(db: Session, owner_name: str, directory_path: str):
+def check_directory_for_owner(db: Session, owner_name: str, directory_path: str, use_cache: bool = False,
+                              media_only: bool = True):
     """
     Checks files in a directory against the database for a specific owner,
     then generates a detailed summary report.
@@ -55,6 +230,8 @@ def check_directory_for_owner(db: Session, owner_name: str, directory_path: str)
         db: The SQLAlchemy session object.
         owner_name: The name of the owner to check for.
         directory_path: The path to the directory to scan.
+        use_cache: Whether to reuse the results of a previous scan of this directory.
+        media_only: Only check files with an extension the import pipeline handles.
     """
     # 1. Validate owner
     print(f"🔎 Verifying owner '{owner_name}' exists...")
@@ -65,52 +242,64 @@ def check_directory_for_owner(db: Session, owner_name: str, directory_path: str)
     print(f"✅ Owner '{owner_name}' found.")
 
     # 2. Validate directory
-    directory = Path(directory_path)
-    if not directory.is_dir():
+    if not os.path.isdir(directory_path):
         print(f"❌ Error: Directory '{directory_path}' does not exist.", file=sys.stderr)
         sys.exit(1)
 
-    # 3. Efficiently fetch all location paths for this owner
-    print("🚀 Fetching all known file paths for this owner...")
-    paths_query = (
-        db.query(Location.path)
-        .join(MediaOwnership)
-        .filter(MediaOwnership.owner_id == owner.id)
-    )
-    owner_paths_in_db: Set[str] = {path_tuple[0] for path_tuple in paths_query.all()}
-    print(f"👍 Found {len(owner_paths_in_db)} database entries for '{owner_name}'.\n")
+    # 3. List the directory and classify files while walking
+    # Normalize the root once; scandir then yields absolute paths for every entry,
+    # which matches how the import pipeline stores Location.path.
+    root_abs = os.path.abspath(directory_path)
 
-    # 4. Scan directory and compile results
-    # Use a nested defaultdict for easily creating the structure
-    # results[extension][directory] = {'found': 0, 'missing': 0}
-    results: Dict[str, Any] = defaultdict(lambda: defaultdict(lambda: {'found': 0, 'missing': 0}))
+    # Each file is reduced to its path plus a small integer group id for its
+    # (extension, directory) pair, instead of holding a tuple per file.
+    dir_ids: Dict[str, int] = {}
+    group_ids: Dict[Tuple[str, int], int] = {}
+    scanned_paths: List[str] = []
+    file_groups = array('I')
 
-    files_in_dir = [p for p in directory.rglob('*') if p.is_file()]
-    total_files = len(files_in_dir)
-    total_found = 0
-    total_missing = 0
+    print(f"🔄 Scanning files in '{root_abs}'...")
+    # Directory listing is I/O-bound, so scan subdirectories concurrently
+    with ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 4)) as pool:
+        for i, (abs_path_str, parent_dir, extension) in enumerate(
+                walk_parallel(root_abs, pool, MEDIA_EXTENSIONS if media_only else None), 1):
+            dir_id = dir_ids.setdefault(parent_dir, len(dir_ids))
+            file_groups.append(group_ids.setdefault((extension, dir_id), len(group_ids)))
+            scanned_paths.append(abs_path_str)
+            if i % 1000 == 0:
+                # Update progress on the same line
+                print(f"   Scanned: {i}", end='\r')
+    total_files = len(scanned_paths)
 
-    print(f"🔄 Scanning {total_files} files in '{directory.resolve()}'...")
-    for i, file_path in enumerate(files_in_dir, 1):
-        # Update progress on the same line
-        print(f"   Processing: {i}/{total_files}", end='\r')
+    # Clear the progress line
+    print(" " * 50, end='\r')
 
-        abs_path_str = str(file_path.resolve())
-        parent_dir = str(file_path.parent)
-        # Use lower() for case-insensitive extension grouping
-        extension = file_path.suffix.lower() if file_path.suffix else ".<no_extension>"
+    # 4. Let the database match the scanned paths against this owner's locations
+    print(f"🚀 Matching {total_files} scanned paths against the database for this owner...")
+    owner_paths_in_db = match_owner_paths(db, owner.id, root_abs, scanned_paths, use_cache)
+    print(f"👍 Found {len(owner_paths_in_db)} matching database entries for '{owner_name}'.\n")
 
+    # 5. Compile results per group
+    found_counts = [0] * len(group_ids)
+    missing_counts = [0] * len(group_ids)
+    for abs_path_str, group_id in zip(scanned_paths, file_groups):
         if abs_path_str in owner_paths_in_db:
-            results[extension][parent_dir]['found'] += 1
-            total_found += 1
+            found_counts[group_id] += 1
         else:
-            results[extension][parent_dir]['missing'] += 1
-            total_missing += 1
+            missing_counts[group_id] += 1
+    total_found = sum(found_counts)
+    total_missing = total_files - total_found
 
-    # Clear the progress line before printing the final report
-    print(" " * 50, end='\r')
+    # 6. Rebuild the nested structure: results[extension][directory] = {'found': 0, 'missing': 0}
+    dir_names = {dir_id: dir_path for dir_path, dir_id in dir_ids.items()}
+    results: Dict[str, Any] = {}
+    for (extension, dir_id), group_id in group_ids.items():
+        results.setdefault(extension, {})[dir_names[dir_id]] = {
+            'found': found_counts[group_id],
+            'missing': missing_counts[group_id],
+        }
 
-    # 5. Print the final, structured report
+    # 7. Print the final, structured report
     print_summary_report(results, total_files, total_found, total_missing)
 
 
@@ -122,12 +311,18 @@ def main():
     )
     parser.add_argument("owner_name", help="The name of the owner to check against.")
     parser.add_argument("directory", help="The path to the directory to scan for files.")
+    parser.add_argument("--cache", action="store_true",
+                        help="Reuse and update the cached results of previous scans of this directory.")
+    parser.add_argument("--all-files", action="store_true",
+                        help="Also check files that are not media (e.g. .json sidecars, Thumbs.db).")
 
     args = parser.parse_args()
 
+    ensure_indexes()
     db: Session = SessionLocal()
     try:
-        check_directory_for_owner(db, args.owner_name, args.directory)
+        check_directory_for_owner(db, args.owner_name, args.directory, use_cache=args.cache,
+                                  media_only=not args.all_files)
     finally:
         db.close()
 
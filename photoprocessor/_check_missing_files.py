@@ -1,33 +1,53 @@
 import os
 import argparse
-from typing import List, Dict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby
+from operator import itemgetter
+from typing import List, Dict, Tuple
 
 from tqdm import tqdm
-from sqlalchemy.orm import Session, selectinload
+from sqlalchemy import select
+from sqlalchemy.orm import Session
 from photoprocessor import models
 from photoprocessor.database import SessionLocal
 
 
-def get_media_files_for_owner(db: Session, owner_name: str) -> List[models.MediaFile]:
+def get_media_files_for_owner(db: Session, owner_name: str) -> List[Tuple[str, Tuple[str, ...]]]:
     """
-    Queries all unique MediaFile objects associated with an owner,
-    eagerly loading their locations.
+    Queries all unique media files associated with an owner, together with
+    the paths of all their locations.
+    Returns a list of (file_hash, paths) tuples.
     """
     owner = db.query(models.Owner).filter(models.Owner.name == owner_name).first()
     if not owner:
         return []
 
-    # This query joins through the tables to find all unique media files for the owner
-    # and eagerly loads the 'locations' for each media file to prevent N+1 queries.
-    return db.query(models.MediaFile).join(
-        models.Location
-    ).join(
-        models.MediaOwnership
-    ).filter(
-        models.MediaOwnership.owner_id == owner.id
-    ).distinct().options(
-        selectinload(models.MediaFile.locations)
-    ).all()
+    # IDs of every media file the owner has at least one location for
+    owned_media_file_ids = (
+        select(models.Location.media_file_id)
+        .join(models.MediaOwnership)
+        .where(models.MediaOwnership.owner_id == owner.id)
+    )
+
+    # A single Core query for (hash, path) of all locations of those files, ordered by
+    # hash so they can be grouped in one pass without building any ORM objects.
+    stmt = (
+        select(models.MediaFile.file_hash, models.Location.path)
+        .join(models.Location, models.Location.media_file_id == models.MediaFile.id)
+        .where(models.MediaFile.id.in_(owned_media_file_ids))
+        .order_by(models.MediaFile.file_hash)
+    )
+    rows = db.execute(stmt).all()
+
+    return [
+        (file_hash, tuple(path for _, path in group))
+        for file_hash, group in groupby(rows, key=itemgetter(0))
+    ]
+
+
+def _location_exists(path: str) -> bool:
+    """Checks whether a path exists, without building a stat result object."""
+    return os.access(path, os.F_OK)
 
 
 def main(owner_name: str):
@@ -38,6 +58,7 @@ def main(owner_name: str):
     print(f"Checking media file locations for owner: '{owner_name}'")
     print("-" * 30)
 
+    models.ensure_indexes()
     with SessionLocal() as db:
         media_files = get_media_files_for_owner(db, owner_name)
 
@@ -48,19 +69,26 @@ def main(owner_name: str):
     # A dictionary to store missing locations, keyed by the media file's hash
     missing_locations_report: Dict[str, List[str]] = {}
 
-    print("Verifying locations for each media file...")
-    with tqdm(total=len(media_files), desc="Scanning media files", unit="file") as pbar:
-        for media_file in media_files:
-            missing_paths_for_this_file = []
-            for loc in media_file.locations:
-                if not os.path.exists(loc.path):
-                    missing_paths_for_this_file.append(loc.path)
-
-            if missing_paths_for_this_file:
-                missing_locations_report[media_file.file_hash] = sorted(missing_paths_for_this_file)
+    # Flatten all locations so the existence checks can run concurrently.
+    # Each check is a single latency-bound syscall, which matters a lot on network drives.
+    hash_path_pairs = [
+        (file_hash, path)
+        for file_hash, paths in media_files
+        for path in paths
+    ]
 
+    print("Verifying locations for each media file...")
+    with ThreadPoolExecutor(max_workers=32) as executor, \
+            tqdm(total=len(hash_path_pairs), desc="Scanning locations", unit="location") as pbar:
+        paths = [path for _, path in hash_path_pairs]
+        for (file_hash, path), exists in zip(hash_path_pairs, executor.map(_location_exists, paths)):
+            if not exists:
+                missing_locations_report.setdefault(file_hash, []).append(path)
             pbar.update(1)
 
+    for paths in missing_locations_report.values():
+        paths.sort()
+
     # --- Print Summary Report ---
     print("\n--- Verification Report ---")
     print(f"Total unique media files checked: {len(media_files)}")
@@ -1,6 +1,61 @@
 import os
 import re
 import argparse
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+
+_DIGIT_RE = re.compile(r'\d')
+# str.translate is much cheaper than re.sub for plain ASCII digits
+_DIGIT_TABLE = str.maketrans('0123456789', '?' * 10)
+
+
+def _mask_digits(base_name: str) -> str:
+    """Replaces all digits with '?'. Falls back to the regex for non-ASCII digits."""
+    if base_name.isascii():
+        return base_name.translate(_DIGIT_TABLE)
+    return _DIGIT_RE.sub('?', base_name)
+
+
+def _collect_formats(directory: str, recursive: bool = True) -> Tuple[int, Dict[str, str]]:
+    """
+    Walks a directory with os.scandir and builds its {format_string -> example} map.
+    Runs inside a worker process, so it only returns plain data.
+    """
+    formats: Dict[str, str] = {}
+    files_scanned = 0
+    stack = [directory]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if recursive:
+                                stack.append(entry.path)
+                            continue
+                        if not entry.is_file():
+                            continue
+                    except OSError:
+                        continue
+                    files_scanned += 1
+                    # Get the filename part without its extension
+                    base_name = os.path.splitext(entry.name)[0]
+                    # Replace all digits with '?' to create the format string
+                    formats[_mask_digits(base_name)] = base_name
+        except OSError:
+            continue
+    return files_scanned, formats
+
+
+def _list_subdirectories(directory: str) -> List[str]:
+    """Returns the immediate subdirectories of a directory."""
+    try:
+        with os.scandir(directory) as it:
+            return [entry.path for entry in it if entry.is_dir(follow_symlinks=False)]
+    except OSError:
+        return []
+
 
 def find_filename_formats(top_folder: str):
     """
@@ -14,25 +69,16 @@ def find_filename_formats(top_folder: str):
         print(f"❌ Error: Directory not found at '{top_folder}'")
         return
 
-    # Dictionary to store: {format_string -> last_seen_example}
-    filename_formats = {}
-    files_scanned = 0
-
     print(f"🔍 Scanning '{os.path.abspath(top_folder)}' for filename formats...")
 
-    # Recursively walk through the directory tree
-    for root, _, files in os.walk(top_folder):
-        for filename in files:
-            files_scanned += 1
-            # Get the filename part without its extension
-            base_name = os.path.splitext(filename)[0]
-
-            # Replace all digits with '?' to create the format string
-            format_string = re.sub(r'\d', '?', base_name)
-
-            # Store the format and the current base_name as its example
-            # This automatically keeps the last-seen value for each format
-            filename_formats[format_string] = base_name
+    # Files directly in the top folder are handled here; every subtree is
+    # walked in its own worker process and the partial results are merged.
+    files_scanned, filename_formats = _collect_formats(top_folder, recursive=False)
+    with ProcessPoolExecutor() as executor:
+        for sub_scanned, sub_formats in executor.map(_collect_formats, _list_subdirectories(top_folder)):
+            files_scanned += sub_scanned
+            # This keeps the last-seen example for each format
+            filename_formats.update(sub_formats)
 
     print(f"\n✅ Scan complete. Analyzed {files_scanned} files.")
     print(f"Found {len(filename_formats)} unique filename formats.\n")
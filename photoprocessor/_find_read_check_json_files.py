@@ -1,8 +1,76 @@
 import os
+import sys
 import json
 import argparse
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple
 from tqdm import tqdm  # Import the tqdm library
 
+try:
+    # orjson is an optional, much faster drop-in for decoding
+    import orjson
+
+    _json_loads = orjson.loads
+    _JSON_DECODE_ERRORS = (json.JSONDecodeError, orjson.JSONDecodeError)
+except ImportError:
+    _json_loads = json.loads
+    _JSON_DECODE_ERRORS = (json.JSONDecodeError,)
+
+
+def _collect_json_paths(directory: str) -> List[str]:
+    """Recursively collects all .json file paths below a directory using os.scandir."""
+    json_file_paths = []
+    stack = [directory]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.name.lower().endswith('.json') and entry.is_file():
+                            json_file_paths.append(entry.path)
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+    return json_file_paths
+
+
+def _check_json_file(file_path: str) -> Tuple[List[str], int]:
+    """
+    Checks a single JSON file for a valid 'title' value.
+    Runs in a worker process. Returns the lines to report and the number of issues found.
+    """
+    lines = []
+    issue_count = 0
+    try:
+        with open(file_path, 'rb') as f:
+            data = _json_loads(f.read())
+
+        title_value = data.get('title')
+
+        if title_value is None or not isinstance(title_value, str) or not title_value.strip() or title_value.strip() == '':
+            lines.append(os.path.abspath(file_path))
+            issue_count += 1
+        else:
+            # if title value contains -edit or -edited (case insensitive), also report it
+            if '-edit' in title_value.lower() or '-edited' in title_value.lower():
+                lines.append(os.path.abspath(file_path))
+                issue_count += 1
+
+            if '(' in title_value and ')' in title_value:
+                lines.append(os.path.abspath(file_path))
+                issue_count += 1
+
+    except _JSON_DECODE_ERRORS:
+        lines.append(f"⚠️  Warning: Could not decode JSON in file: {os.path.abspath(file_path)}")
+    except Exception as e:
+        lines.append(f"❌ Error processing file {os.path.abspath(file_path)}: {e}")
+
+    return lines, issue_count
+
 
 def find_jsons_without_title(directory: str):
     """
@@ -15,11 +83,7 @@ def find_jsons_without_title(directory: str):
     print(f"🔍 Preliminary scan: Finding all .json files in {os.path.abspath(directory)}...")
 
     # --- First Pass: Collect all file paths to get a total for the progress bar ---
-    json_file_paths = []
-    for root, _, files in os.walk(directory):
-        for filename in files:
-            if filename.lower().endswith('.json'):
-                json_file_paths.append(os.path.join(root, filename))
+    json_file_paths = _collect_json_paths(directory)
 
     if not json_file_paths:
         print("\nNo .json files found in the specified directory.")
@@ -28,33 +92,19 @@ def find_jsons_without_title(directory: str):
     print(f"Found {len(json_file_paths)} files. Now checking contents...")
     issue_count = 0
 
-    # --- Second Pass: Process the files with a tqdm progress bar ---
-    # Wrap the list of paths in tqdm() to create and manage the progress bar
-    for file_path in tqdm(json_file_paths, desc="Checking JSONs", unit="file"):
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+    # --- Second Pass: Parse the files in a process pool with a tqdm progress bar ---
+    # JSON decoding is CPU-bound, so the files are spread across processes.
+    # Report lines are buffered and written once after the progress bar closes,
+    # instead of locking and flushing through tqdm.write() for every hit.
+    report_lines = []
+    with ProcessPoolExecutor() as executor:
+        results = executor.map(_check_json_file, json_file_paths, chunksize=64)
+        for lines, file_issue_count in tqdm(results, total=len(json_file_paths), desc="Checking JSONs", unit="file"):
+            report_lines.extend(lines)
+            issue_count += file_issue_count
 
-            title_value = data.get('title')
-
-            if title_value is None or not isinstance(title_value, str) or not title_value.strip() or title_value.strip() == '':
-                # Use tqdm.write() to print output without disturbing the progress bar
-                tqdm.write(os.path.abspath(file_path))
-                issue_count += 1
-            else:
-                # if title value contains -edit or -edited (case insensitive), also report it
-                if '-edit' in title_value.lower() or '-edited' in title_value.lower():
-                    tqdm.write(os.path.abspath(file_path))
-                    issue_count += 1
-
-                if '(' in title_value and ')' in title_value:
-                    tqdm.write(os.path.abspath(file_path))
-                    issue_count += 1
-
-        except json.JSONDecodeError:
-            tqdm.write(f"⚠️  Warning: Could not decode JSON in file: {os.path.abspath(file_path)}")
-        except Exception as e:
-            tqdm.write(f"❌ Error processing file {os.path.abspath(file_path)}: {e}")
+    if report_lines:
+        sys.stdout.write("\n".join(report_lines) + "\n")
 
     print(f"\n✅ Scan complete. Found {issue_count} files missing a valid 'title' key.")
 
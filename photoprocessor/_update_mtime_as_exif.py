@@ -19,7 +19,9 @@ import os
 import argparse
 from datetime import datetime, timezone
 
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
 from tqdm import tqdm
 
 # Ensure your project structure allows this import.
@@ -28,6 +30,41 @@ from tqdm import tqdm
 from photoprocessor.database import SessionLocal
 from photoprocessor.models import Owner, Location, MetadataSource, MetadataEntry, MediaOwnership
 
+# Number of values per IN (...) query / multi-row INSERT, kept below SQLite's variable limit
+CHUNK_SIZE = 1000
+# Number of files written per transaction
+COMMIT_EVERY = 5000
+
+
+def _chunked(items: list, size: int):
+    """Yields consecutive slices of at most `size` items."""
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _collect_mtimes(abs_paths: list[str]) -> dict[str, float]:
+    """
+    Returns {abs_path: st_mtime} for the given paths that exist on disk.
+    Each parent directory is listed once with os.scandir instead of stat-ing every path separately.
+    """
+    wanted_by_dir: dict[str, set[str]] = {}
+    for abs_path in abs_paths:
+        wanted_by_dir.setdefault(os.path.dirname(abs_path), set()).add(abs_path)
+
+    mtimes = {}
+    for directory, wanted in wanted_by_dir.items():
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    if entry.path in wanted:
+                        try:
+                            mtimes[entry.path] = entry.stat().st_mtime
+                        except OSError:
+                            continue
+        except OSError:
+            continue
+    return mtimes
+
 
 def update_datetime_from_mtime(db: Session, filelist_path: str, base_dir: str, owner_name: str):
     """
@@ -64,77 +101,102 @@ def update_datetime_from_mtime(db: Session, filelist_path: str, base_dir: str, o
 
     stats = {"success": 0, "db_not_found": 0, "owner_mismatch": 0, "fs_not_found": 0}
 
-    # 3. Process each file with a progress bar
-    for filename in tqdm(filenames, desc="Updating Metadata", unit="file"):
-        full_path = os.path.join(base_dir, filename)
-        abs_path = os.path.abspath(full_path)
+    # 3. Get the file modification time of every file from the filesystem
+    # Resolve the base directory once; normpath on the joined string needs no getcwd() per file
+    base_abs = os.path.abspath(base_dir)
+    requested_paths = [os.path.normpath(os.path.join(base_abs, filename)) for filename in filenames]
+    disk_mtimes = _collect_mtimes(requested_paths)
 
-        # a. Get file modification time from the filesystem
-        try:
-            mtime = os.path.getmtime(abs_path)
-            mod_datetime = datetime.fromtimestamp(mtime)
-        except FileNotFoundError:
+    mtimes_by_path = {}
+    for abs_path in tqdm(requested_paths, desc="Reading mtimes", unit="file"):
+        mtime = disk_mtimes.get(abs_path)
+        if mtime is None:
             tqdm.write(f"Warning: File not found on disk: {abs_path}")
             stats["fs_not_found"] += 1
             continue
+        mtimes_by_path[abs_path] = datetime.fromtimestamp(mtime)
+
+    # 4. Resolve locations, ownership and existing 'exif' sources with a few IN queries per chunk
+    all_paths = list(mtimes_by_path)
+    location_ids_by_path = {}
+    owned_location_ids = set()
+    exif_source_ids = {}
+    for chunk in _chunked(all_paths, CHUNK_SIZE):
+        location_ids_by_path.update(
+            db.execute(select(Location.path, Location.id).where(Location.path.in_(chunk))).all()
+        )
+
+    all_location_ids = list(location_ids_by_path.values())
+    for chunk in _chunked(all_location_ids, CHUNK_SIZE):
+        owned_location_ids.update(db.scalars(
+            select(MediaOwnership.location_id).where(
+                MediaOwnership.owner_id == owner.id,
+                MediaOwnership.location_id.in_(chunk)
+            )
+        ))
+        exif_source_ids.update(db.execute(
+            select(MetadataSource.location_id, MetadataSource.id).where(
+                MetadataSource.location_id.in_(chunk),
+                MetadataSource.source == 'exif'
+            )
+        ).all())
 
-        # b. Find the location in the database, pre-loading owner info to prevent N+1 queries
-        location = db.query(Location).options(
-            joinedload(Location.owners).joinedload(MediaOwnership.owner)
-        ).filter(Location.path == abs_path).first()
-
-        if not location:
+    # 5. Decide per file what needs to be written
+    entries_by_location_id = {}
+    for abs_path, mod_datetime in mtimes_by_path.items():
+        location_id = location_ids_by_path.get(abs_path)
+        if location_id is None:
             stats["db_not_found"] += 1
             continue
 
-        # c. Verify ownership
-        if not any(ownership.owner_id == owner.id for ownership in location.owners):
+        if location_id not in owned_location_ids:
             stats["owner_mismatch"] += 1
             continue
 
-        # d. Find or create the 'exif' MetadataSource for this location
+        entries_by_location_id[location_id] = mod_datetime
+        stats["success"] += 1
+
+    # 6. Write the entries in chunks, committing each one so the session stays small
+    # and a crash only loses the chunk that was in progress.
+    note = {"note": f"Source created by update_mtime_as_exif.py at {datetime.now(timezone.utc).isoformat()}"}
+    pending_items = list(entries_by_location_id.items())
+    print(f"\nCommitting changes to the database in chunks of {COMMIT_EVERY}...")
+    for commit_chunk in _chunked(pending_items, COMMIT_EVERY):
+        # a. Create the missing 'exif' MetadataSources in one flush
         # This is the parent object for all EXIF-related key-value pairs
-        exif_source = db.query(MetadataSource).filter(
-            MetadataSource.location_id == location.id,
-            MetadataSource.source == 'exif'
-        ).first()
-
-        if not exif_source:
-            exif_source = MetadataSource(
-                location=location,
-                source='exif',
-                raw_data={"note": f"Source created by update_mtime_as_exif.py at {datetime.now(timezone.utc).isoformat()}"}
-            )
-            db.add(exif_source)
-
-        # e. Find an existing 'EXIF:DateTimeOriginal' entry for this source
-        metadata_entry = db.query(MetadataEntry).filter(
-            MetadataEntry.source_id == exif_source.id,
-            MetadataEntry.key == 'EXIF:DateTimeOriginal'
-        ).first()
-
-        if metadata_entry:
-            # Update the existing entry's datetime value
-            metadata_entry.value_dt = mod_datetime
-            metadata_entry.value_str = None  # Clear other potential value types
-            metadata_entry.value_real = None
-        else:
-            # Create a new entry if it doesn't exist
-            new_entry = MetadataEntry(
-                source_info=exif_source,
-                key='EXIF:DateTimeOriginal',
-                value_dt=mod_datetime
+        new_sources = [
+            MetadataSource(location_id=location_id, source='exif', raw_data=note)
+            for location_id, _ in commit_chunk
+            if location_id not in exif_source_ids
+        ]
+        if new_sources:
+            db.add_all(new_sources)
+            db.flush()
+            exif_source_ids.update((source.location_id, source.id) for source in new_sources)
+
+        # b. Upsert the 'EXIF:DateTimeOriginal' entries, clearing other potential value types on update
+        entry_rows = [
+            {"source_id": exif_source_ids[location_id], "key": 'EXIF:DateTimeOriginal', "value_dt": mod_datetime}
+            for location_id, mod_datetime in commit_chunk
+        ]
+        for chunk in _chunked(entry_rows, CHUNK_SIZE):
+            upsert_stmt = sqlite_insert(MetadataEntry).values(chunk)
+            upsert_stmt = upsert_stmt.on_conflict_do_update(
+                index_elements=[MetadataEntry.source_id, MetadataEntry.key],
+                set_={
+                    "value_dt": upsert_stmt.excluded.value_dt,
+                    "value_str": None,
+                    "value_real": None,
+                }
             )
-            db.add(new_entry)
-
-        stats["success"] += 1
+            db.execute(upsert_stmt)
 
-    # 4. Commit all changes to the database in a single transaction
-    print("\nCommitting changes to the database...")
-    db.commit()
+        db.commit()
+        # The new sources are persisted; drop them from the identity map
+        db.expunge_all()
     print("Commit complete.")
 
-    # 5. Print a summary of the operation
+    # 7. Print a summary of the operation
     print("\n--- Update Summary ---")
     print(f"✅ Successfully updated/created metadata for {stats['success']} files.")
     if stats['db_not_found'] > 0:
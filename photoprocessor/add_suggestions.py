@@ -1,22 +1,23 @@
 import os
-import argparse
-import sys
-from tqdm import tqdm
-from sqlalchemy.orm import selectinload
-
-# Make sure the script can find your project modules
-sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from sqlalchemy import func, select, update
 
 from photoprocessor import models
 from photoprocessor.database import SessionLocal
 
+# Number of rows streamed per fetch, and per bulk UPDATE batch
+UPDATE_CHUNK_SIZE = 5000
+
 
 def main(owner_name: str, input_dir: str, base_dir: str, recursive: bool):
     """
     Adds suggested export paths to media files owned by a user, based on a
     folder's structure.
     """
+    # Imported here so importing this module for main() stays cheap
+    from tqdm import tqdm
+
     print("Initializing suggestion tool...")
+    models.ensure_indexes()
     input_dir_abs = os.path.abspath(input_dir)
     base_dir_abs = os.path.abspath(base_dir)
 
@@ -30,7 +31,9 @@ def main(owner_name: str, input_dir: str, base_dir: str, recursive: bool):
     update_count = 0
     with SessionLocal() as db:
         print(f"Finding owner '{owner_name}'...")
-        owner = db.query(models.Owner).filter(models.Owner.name == owner_name).first()
+        owner = db.execute(
+            select(models.Owner.id, models.Owner.name).where(models.Owner.name == owner_name)
+        ).first()
         if not owner:
             print(f"❌ ERROR: Owner '{owner_name}' not found in the database.")
             return
@@ -40,45 +43,81 @@ def main(owner_name: str, input_dir: str, base_dir: str, recursive: bool):
         path_prefix = os.path.join(input_dir_abs, '')
 
         print(f"Querying for files in '{input_dir_abs}'...")
-        ownerships_to_update = db.query(models.MediaOwnership).join(
+        # Only the columns needed are selected; no ORM objects are built or tracked.
+        ownerships_stmt = select(
+            models.MediaOwnership.id,
+            models.Location.path,
+            models.MediaOwnership.suggested_export_path
+        ).join(
             models.Location
-        ).filter(
-            models.MediaOwnership.owner_id == owner.id,
-            models.Location.path.startswith(path_prefix)
-        ).options(
-            selectinload(models.MediaOwnership.location)
-        ).all()
-
-        if not ownerships_to_update:
+        ).where(
+            models.MediaOwnership.owner_id == owner.id
+        )
+
+        # If not recursive, only process files directly in the input_dir: their parent directory
+        # is an exact match on the indexed LOCATION_PARENT_DIR expression. Otherwise the
+        # prefix match is written as a range on the path so SQLite can do a range scan
+        # on the index of Location.path (a LIKE 'prefix%' cannot use it).
+        if not recursive:
+            ownerships_stmt = ownerships_stmt.where(models.LOCATION_PARENT_DIR == path_prefix)
+        else:
+            path_prefix_end = path_prefix[:-1] + chr(ord(path_prefix[-1]) + 1)
+            ownerships_stmt = ownerships_stmt.where(
+                models.Location.path >= path_prefix,
+                models.Location.path < path_prefix_end
+            )
+
+        # Paths below the base directory are made relative by slicing off this prefix
+        base_prefix = os.path.join(base_dir_abs, '')
+        base_prefix_len = len(base_prefix)
+
+        total_ownerships = db.execute(
+            select(func.count()).select_from(ownerships_stmt.subquery())
+        ).scalar_one()
+        if not total_ownerships:
             print("No files owned by this user found in the specified input directory.")
             return
 
-        print(f"Found {len(ownerships_to_update)} files. Calculating suggestions relative to '{base_dir_abs}'...")
-
-        with tqdm(total=len(ownerships_to_update), desc="Updating Suggestions", unit="file") as pbar:
-            for mo in ownerships_to_update:
-                try:
-                    # Calculate the path relative to the BASE directory.
-                    relative_path = os.path.relpath(mo.location.path, base_dir_abs)
-
-                    # The suggestion is the directory part of the relative path.
-                    suggested_dir = os.path.dirname(relative_path)
-
-                    # If not recursive, only process files directly in the input_dir.
-                    # We check this by seeing if the file's parent dir is the same as the input_dir.
-                    if not recursive and os.path.dirname(mo.location.path) != input_dir_abs:
-                        pbar.update(1)
+        print(f"Found {total_ownerships} files. Calculating suggestions relative to '{base_dir_abs}'...")
+
+        # Pending updates are written every UPDATE_CHUNK_SIZE rows while streaming,
+        # so memory stays bounded no matter how many files match.
+        updates = []
+        update_count = 0
+        with tqdm(total=total_ownerships, desc="Updating Suggestions", unit="file") as pbar:
+            # The bar is advanced in steps of 1024 rows instead of once per row
+            processed = 0
+            for mo_id, location_path, current_suggestion in db.execute(
+                    ownerships_stmt, execution_options={"yield_per": UPDATE_CHUNK_SIZE}):
+                processed += 1
+                if not processed & 0x3FF:
+                    pbar.update(1024)
+
+                if location_path.startswith(base_prefix):
+                    # Common case: the file is below the BASE directory, so the suggestion
+                    # is the directory part of the path after the base prefix.
+                    sep_index = location_path.rfind(os.sep, base_prefix_len)
+                    suggested_dir = location_path[base_prefix_len:sep_index] if sep_index >= 0 else ''
+                else:
+                    try:
+                        # Calculate the path relative to the BASE directory.
+                        suggested_dir = os.path.dirname(os.path.relpath(location_path, base_dir_abs))
+                    except ValueError:
+                        print(f"\nSkipping file on a different drive: {location_path}")
                         continue
 
-                    if mo.suggested_export_path != suggested_dir:
-                        mo.suggested_export_path = suggested_dir
-                        update_count += 1
+                if current_suggestion != suggested_dir:
+                    updates.append({"id": mo_id, "suggested_export_path": suggested_dir})
+                    if len(updates) >= UPDATE_CHUNK_SIZE:
+                        db.execute(update(models.MediaOwnership), updates)
+                        update_count += len(updates)
+                        updates = []
 
-                    pbar.update(1)
-                except ValueError:
-                    print(f"\nSkipping file on a different drive: {mo.location.path}")
-                    pbar.update(1)
-                    continue
+            pbar.update(processed & 0x3FF)
+
+        if updates:
+            db.execute(update(models.MediaOwnership), updates)
+            update_count += len(updates)
 
         if update_count > 0:
             print(f"\nCommitting {update_count} updates to the database...")
@@ -88,12 +127,14 @@ def main(owner_name: str, input_dir: str, base_dir: str, recursive: bool):
             print("\nNo changes needed; all suggestions are already up-to-date.")
 
     print("\n--- Suggestion Update Complete ---")
-    print(f"Processed {len(ownerships_to_update)} file ownership records.")
+    print(f"Processed {total_ownerships} file ownership records.")
     print(f"Updated {update_count} suggested export paths.")
     print("----------------------------------")
 
 
 if __name__ == "__main__":
+    import argparse
+
     parser = argparse.ArgumentParser(
         description="Bulk add suggested export paths based on a folder structure.",
         formatter_class=argparse.RawTextHelpFormatter
@@ -14,8 +14,14 @@ engine = create_engine(DATABASE_URL, echo=False)
 def set_sqlite_pragma(dbapi_connection, connection_record):
     """Sets SQLite PRAGMA for performance on every new connection."""
     cursor = dbapi_connection.cursor()
-    cursor.execute("PRAGMA synchronous = OFF")
-    cursor.execute("PRAGMA journal_mode = MEMORY")
+    # WAL with NORMAL sync is crash-safe and lets readers run alongside a writer.
+    cursor.execute("PRAGMA journal_mode = WAL")
+    cursor.execute("PRAGMA synchronous = NORMAL")
+    cursor.execute("PRAGMA temp_store = MEMORY")
+    cursor.execute("PRAGMA mmap_size = 10737418240")
+    cursor.execute("PRAGMA wal_autocheckpoint = 1000")
+    # Wait up to 5 seconds for a lock instead of failing with SQLITE_BUSY.
+    cursor.execute("PRAGMA busy_timeout = 5000")
     # Set cache size to 1GB. The value is in KiB, so -1000000 = 1,000,000 KiB.
     # Adjust this based on your available system RAM.
     cursor.execute("PRAGMA cache_size = -1000000")
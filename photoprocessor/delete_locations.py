@@ -1,21 +1,22 @@
 import os
-import argparse
-import sys
-from tqdm import tqdm
-from sqlalchemy.orm import joinedload
-
-# Ensure the script can find project modules
-sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from sqlalchemy import delete, select
 
 from photoprocessor import models
 from photoprocessor.database import SessionLocal
 
+# Number of location ids bound into a single DELETE ... WHERE id IN (...) statement
+DELETE_CHUNK_SIZE = 500
+
 
 def main(owner_name: str, folder_path: str, recursive: bool, force: bool):
     """
     Finds and deletes Location records from the database based on owner and path.
     """
+    # Imported here so importing this module for main() stays cheap
+    from tqdm import tqdm
+
     print("Initializing location deletion tool...")
+    models.ensure_indexes()
     folder_path_abs = os.path.abspath(folder_path)
 
     if not os.path.isdir(folder_path_abs):
@@ -25,7 +26,9 @@ def main(owner_name: str, folder_path: str, recursive: bool, force: bool):
     with SessionLocal() as db:
         # 1. Find the owner
         print(f"Finding owner '{owner_name}'...")
-        owner = db.query(models.Owner).filter(models.Owner.name == owner_name).first()
+        owner = db.execute(
+            select(models.Owner.id, models.Owner.name).where(models.Owner.name == owner_name)
+        ).first()
         if not owner:
             print(f"❌ ERROR: Owner '{owner_name}' not found in the database.")
             return
@@ -36,26 +39,27 @@ def main(owner_name: str, folder_path: str, recursive: bool, force: bool):
         # linked to the correct owner.
         path_prefix = os.path.join(folder_path_abs, '')
 
-        query = db.query(models.Location).join(
+        locations_stmt = select(models.Location.id).join(
             models.MediaOwnership
-        ).filter(
-            models.MediaOwnership.owner_id == owner.id,
-            models.Location.path.startswith(path_prefix)
+        ).where(
+            models.MediaOwnership.owner_id == owner.id
         )
 
-        # Eagerly load the owners relationship to prevent extra queries if needed later.
-        query = query.options(joinedload(models.Location.owners))
-
-        locations_to_delete = query.all()
-
-        # 3. If not recursive, filter the results down in Python.
-        # This is more efficient than trying to perform a complex non-recursive
-        # path match in a database-agnostic way.
+        # 3. If not recursive, only keep files directly in the folder: their parent directory
+        # is an exact match on the indexed LOCATION_PARENT_DIR expression. Otherwise the
+        # prefix match is written as a range on the path so SQLite can do a range scan
+        # on the index of Location.path (a LIKE 'prefix%' cannot use it).
         if not recursive:
-            locations_to_delete = [
-                loc for loc in locations_to_delete
-                if os.path.dirname(loc.path) == folder_path_abs
-            ]
+            locations_stmt = locations_stmt.where(models.LOCATION_PARENT_DIR == path_prefix)
+        else:
+            path_prefix_end = path_prefix[:-1] + chr(ord(path_prefix[-1]) + 1)
+            locations_stmt = locations_stmt.where(
+                models.Location.path >= path_prefix,
+                models.Location.path < path_prefix_end
+            )
+
+        # Only the ids are needed; the rows are removed with bulk DELETE statements below.
+        locations_to_delete = db.scalars(locations_stmt).all()
 
         if not locations_to_delete:
             print("✅ No matching locations found for the given criteria. Nothing to do.")
@@ -78,15 +82,24 @@ def main(owner_name: str, folder_path: str, recursive: bool, force: bool):
                 return
 
         # 5. Perform the deletion
-        # This relies on the cascade="all, delete-orphan" setting on the
-        # Location.owners and Location.metadata_sources relationships in models.py
-        # to correctly remove dependent records (MediaOwnership, MetadataSource, etc.).
+        # Bulk DELETE statements bypass the ORM cascade configured on the Location
+        # relationships in models.py, so the dependent records (MetadataEntry,
+        # MetadataSource, MediaOwnership) are deleted explicitly first, all in one
+        # transaction.
         print("\nDeleting records from the database...")
         try:
             with tqdm(total=len(locations_to_delete), desc="Deleting Locations", unit="record") as pbar:
-                for loc in locations_to_delete:
-                    db.delete(loc)
-                    pbar.update(1)
+                for i in range(0, len(locations_to_delete), DELETE_CHUNK_SIZE):
+                    ids = locations_to_delete[i:i + DELETE_CHUNK_SIZE]
+                    source_ids = select(models.MetadataSource.id).where(models.MetadataSource.location_id.in_(ids))
+                    for stmt in (
+                        delete(models.MetadataEntry).where(models.MetadataEntry.source_id.in_(source_ids)),
+                        delete(models.MetadataSource).where(models.MetadataSource.location_id.in_(ids)),
+                        delete(models.MediaOwnership).where(models.MediaOwnership.location_id.in_(ids)),
+                        delete(models.Location).where(models.Location.id.in_(ids)),
+                    ):
+                        db.execute(stmt, execution_options={"synchronize_session": False})
+                    pbar.update(len(ids))
 
             print("Committing changes...")
             db.commit()
@@ -103,6 +116,8 @@ def main(owner_name: str, folder_path: str, recursive: bool, force: bool):
 
 
 if __name__ == "__main__":
+    import argparse
+
     parser = argparse.ArgumentParser(
         description="Delete Location records from the database for a specific owner and folder.",
         formatter_class=argparse.RawTextHelpFormatter
@@ -1,7 +1,13 @@
 # In a new file, e.g., photoprocessor/export_arguments.py
 import abc
-from datetime import datetime, timezone
-from typing import List, Set, Any
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Dict, List, Set, Any
+
+
+def _exif_datetime_str(dt: datetime) -> str:
+    """Formats dt as 'YYYY:MM:DD HH:MM:SS'; cheaper than strftime for this fixed format."""
+    return f"{dt.year:04d}:{dt.month:02d}:{dt.day:02d} {dt.hour:02d}:{dt.minute:02d}:{dt.second:02d}"
 
 
 class ExportArgument(abc.ABC):
@@ -21,35 +27,109 @@ class ExportArgument(abc.ABC):
         pass
 
 
+def _format_datetime_value(value: datetime) -> str:
+    # format like '%Y:%m:%d %H:%M:%S' if has no timezone, else '%Y:%m:%d %H:%M:%S%z' if timezone aware
+    timezone_str = ""
+    if value.tzinfo:
+        offset = value.strftime('%z')
+        timezone_str = offset[:3] + ':' + offset[3:]
+
+    return _exif_datetime_str(value) + timezone_str
+
+
+# Exact type -> formatter for SimpleArgument values; other types use str()
+_VALUE_FORMATTERS = {
+    datetime: _format_datetime_value,
+    str: lambda value: value,
+    int: str,
+    float: str,
+}
+
+
 class SimpleArgument(ExportArgument):
     """Handles simple key-value pairs."""
 
     def __init__(self, tag: str, value: Any):
         super().__init__(value)
         self.tag = tag
+        self._prefix = f"-{tag}="
+        self._value_str = None
 
     def build(self) -> List[str]:
         if self.value is None:
             return []
 
-
-        value_str = self.value_str()
-
-        return [f"-{self.tag}={value_str}"]
+        return [self._prefix + self.value_str()]
 
     def get_managed_tags(self) -> Set[str]:
         return {f"-{self.tag}"}
 
     def value_str(self) -> str:
-        if isinstance(self.value, datetime):
-            # format like '%Y:%m:%d %H:%M:%S' if has no timezone, else '%Y:%m:%d %H:%M:%S%z' if timezone aware
-            timezone_str = ""
-            if self.value.tzinfo:
-                offset = self.value.strftime('%z')
-                timezone_str = offset[:3] + ':' + offset[3:]
-
-            return self.value.strftime('%Y:%m:%d %H:%M:%S') + timezone_str
-        return str(self.value)
+        # The value does not change after construction, so it is formatted only once
+        if self._value_str is None:
+            formatter = _VALUE_FORMATTERS.get(type(self.value))
+            if formatter is None:
+                # Subclasses of datetime still get the EXIF date format
+                formatter = _format_datetime_value if isinstance(self.value, datetime) else str
+            self._value_str = formatter(self.value)
+        return self._value_str
+
+
+# Tag tables for DateTimeArgument, specialized once per (date_type, has_tz) combination.
+# Each entry is an '-TAG=' argument prefix and the name of the value appended to it:
+# lt = local time, iso = ISO 8601 with offset, utc = UTC time, off = '+HH:MM' offset.
+_TAGS_TAKEN_NOTZ = (
+    ("-EXIF:DateTimeOriginal=", "lt"),
+    ("-EXIF:CreateDate=", "lt"),
+    ("-FileCreateDate=", "lt"),
+)
+_TAGS_TAKEN_TZ = _TAGS_TAKEN_NOTZ + (
+    ("-EXIF:OffsetTimeOriginal=", "off"),
+    ("-XMP:DateTimeOriginal=", "iso"),
+    ("-XMP:CreateDate=", "iso"),
+    ("-QuickTime:CreateDate=", "utc"),
+    ("-Keys:CreationDate=", "iso"),
+    ("-QuickTime:CreationDate=", "iso"),
+)
+_TAGS_MOD_NOTZ = (
+    ("-EXIF:ModifyDate=", "lt"),
+    ("-FileModifyDate=", "lt"),
+)
+_TAGS_MOD_TZ = _TAGS_MOD_NOTZ + (
+    ("-XMP:ModifyDate=", "iso"),
+    ("-QuickTime:ModifyDate=", "utc"),
+    ("-EXIF:OffsetTime=", "off"),
+)
+
+# (date_type, has_tz) -> (argument prefixes, managed tag names)
+_DATETIME_TAG_TABLES = {
+    (date_type, has_tz): (table, frozenset(prefix[:-1] for prefix, _ in table))
+    for (date_type, has_tz), table in {
+        ("taken", False): _TAGS_TAKEN_NOTZ,
+        ("taken", True): _TAGS_TAKEN_TZ,
+        ("modified", False): _TAGS_MOD_NOTZ,
+        ("modified", True): _TAGS_MOD_TZ,
+    }.items()
+}
+_NO_DATETIME_TAGS = ((), frozenset())
+
+
+@lru_cache(maxsize=4096)
+def _aware_datetime_strings(local: datetime, offset: timedelta) -> Dict[str, str]:
+    """
+    Returns the DateTimeArgument values for an aware datetime, given as its naive local
+    time and UTC offset. The key must not be the aware datetime itself: aware datetimes
+    for the same instant in different zones compare equal. Burst shots and files copied
+    from one event share these, so they are formatted once. Do not modify the result.
+    """
+    value = local.replace(tzinfo=timezone(offset))
+    offset_str = value.strftime('%z')
+    return {
+        "lt": _exif_datetime_str(local),
+        "iso": value.isoformat(),
+        "utc": _exif_datetime_str(value.astimezone(timezone.utc)),
+        "off": f"{offset_str[:3]}:{offset_str[3:]}",
+    }
 
 
 class DateTimeArgument(ExportArgument):
@@ -60,82 +140,24 @@ class DateTimeArgument(ExportArgument):
         super().__init__(value)
         self.date_type = date_type
 
-    def get_managed_tags(self) -> Set[str]:
-        tags = set()
+    def _tag_table(self):
         if not self.value or not isinstance(self.value, datetime):
-            return tags
-
-        if self.date_type == "taken":
-            tags.update({
-                "-EXIF:DateTimeOriginal",
-                "-EXIF:CreateDate",
-                "-FileCreateDate",
-            })
-        elif self.date_type == "modified":
-            tags.update({
-                "-EXIF:ModifyDate",
-                "-FileModifyDate",
-            })
-
-        if self.value.tzinfo:
-            if self.date_type == "taken":
-                tags.update({
-                    "-EXIF:OffsetTimeOriginal",
-                    "-XMP:DateTimeOriginal",
-                    "-XMP:CreateDate",
-                    "-QuickTime:CreateDate",
-                    "-Keys:CreationDate",
-                    "-QuickTime:CreationDate",
-                })
-            elif self.date_type == "modified":
-                tags.update({
-                    "-XMP:ModifyDate",
-                    "-QuickTime:ModifyDate",
-                    "-EXIF:OffsetTime",
-                })
-        return tags
+            return _NO_DATETIME_TAGS
+        return _DATETIME_TAG_TABLES.get((self.date_type, self.value.tzinfo is not None), _NO_DATETIME_TAGS)
+
+    def get_managed_tags(self) -> Set[str]:
+        return self._tag_table()[1]
 
     def build(self) -> List[str]:
-        if not self.value or not isinstance(self.value, datetime):
+        table = self._tag_table()[0]
+        if not table:
             return []
 
-        args = []
-        # Format for EXIF/File dates (local time, no offset)
-        local_time_str = self.value.strftime('%Y:%m:%d %H:%M:%S')
-
-        if self.date_type == "taken":
-            args.extend([
-                f"-EXIF:DateTimeOriginal={local_time_str}",
-                f"-EXIF:CreateDate={local_time_str}",
-                f"-FileCreateDate={local_time_str}",
-            ])
-        elif self.date_type == "modified":
-            args.extend([
-                f"-EXIF:ModifyDate={local_time_str}",
-                f"-FileModifyDate={local_time_str}",
-            ])
-
-        # If the date is timezone-aware, write additional offset and UTC tags
-        if self.value.tzinfo:
-            offset_str = self.value.strftime('%z')
-            offset_str_formatted = f"{offset_str[:3]}:{offset_str[3:]}"
-            utc_date = self.value.astimezone(timezone.utc)
-            utc_time_str = utc_date.strftime('%Y:%m:%d %H:%M:%S')
-
-            if self.date_type == "taken":
-                args.extend([
-                    f"-EXIF:OffsetTimeOriginal={offset_str_formatted}",
-                    f"-XMP:DateTimeOriginal={self.value.isoformat()}",
-                    f"-XMP:CreateDate={self.value.isoformat()}",
-                    f"-QuickTime:CreateDate={utc_time_str}",
-                    f"-Keys:CreationDate={self.value.isoformat()}",
-                    f"-QuickTime:CreationDate={self.value.isoformat()}",
-                ])
-            elif self.date_type == "modified":
-                args.extend([
-                    f"-XMP:ModifyDate={self.value.isoformat()}",
-                    f"-QuickTime:ModifyDate={utc_time_str}",
-                    f"-EXIF:OffsetTime={offset_str_formatted}",
-                ])
-
-        return args
\ No newline at end of file
+        # If the date is timezone-aware, the table also holds offset, ISO and UTC tags
+        if self.value.tzinfo is None:
+            # Format for EXIF/File dates (local time, no offset)
+            local_time_str = _exif_datetime_str(self.value)
+            return [prefix + local_time_str for prefix, _ in table]
+
+        values = _aware_datetime_strings(self.value.replace(tzinfo=None), self.value.utcoffset())
+        return [prefix + values[field] for prefix, field in table]
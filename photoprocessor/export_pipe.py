@@ -1,23 +1,30 @@
 import os
 import argparse
+import errno
 import shutil
 import subprocess
 import logging
+import logging.handlers
+import queue
 import time
 from datetime import datetime, timezone
 from fileinput import filename
-from typing import List, Dict, Tuple, Any
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Tuple, Any, Iterator, Callable
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import sys
 import re
-import tempfile
 import contextlib
 import dataclasses
 from enum import Enum, auto
 import threading
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
 
 from tqdm import tqdm
-from sqlalchemy.orm import Session, selectinload
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
 from photoprocessor.database import engine, SessionLocal
 from photoprocessor import models
 from photoprocessor.export_arguments import ExportArgument, DateTimeArgument, SimpleArgument
@@ -28,7 +35,18 @@ from photoprocessor.merger import MergeStep, GPSMergeStep, MergeContext, BasicFi
 CONFIG = {
     "EXIFTOOL_PATH": "exiftool",
     "BATCH_SIZE": 100,
-    "MAX_WORKERS": 4,
+    # One export worker thread (each with its own ExifTool daemon) per CPU core
+    "MAX_WORKERS": os.cpu_count() or 4,
+    # Batches submitted ahead of the workers; bounds how many locations are held in memory
+    "MAX_PENDING_BATCHES": 2 * (os.cpu_count() or 4),
+    # Hard link files exported without metadata changes to their source instead of
+    # copying them (same filesystem only). The export then shares data with the original.
+    "HARDLINK": False,
+    # Clone files with FICLONE on copy-on-write filesystems (Btrfs, XFS) before copying them
+    "ALLOW_REFLINK": True,
+    # Pass -fast to the ExifTool writes. Off by default: -fast skips the scan for JPEG
+    # trailers (e.g. the Samsung trailer), so check that exports keep them before enabling it.
+    "EXIFTOOL_FAST": False,
 }
 
 
@@ -47,8 +65,8 @@ class ExportStatus(Enum):
 @dataclasses.dataclass
 class FileExportJob:
     """A dataclass to hold all information for exporting a single media file."""
-    media_file: models.MediaFile
-    source_location_to_copy: models.Location
+    media_file: 'MediaFileRow'
+    source_location_to_copy: 'LocationRow'
     export_arguments: List[ExportArgument]
     relative_path: str
 
@@ -65,153 +83,511 @@ class FileExportJob:
         return args
 
 
+@dataclasses.dataclass(slots=True)
+class MetadataEntryRow:
+    """A detached MetadataEntry with only the columns the merge pipeline reads."""
+    id: int
+    key: str
+    value_str: str | None
+    value_dt: datetime | None
+    value_real: float | None
+
+    @property
+    def value(self) -> str | datetime | float | None:
+        """Returns the value in its appropriate type."""
+        if self.value_str is not None:
+            return self.value_str
+        if self.value_dt is not None:
+            return self.value_dt
+        if self.value_real is not None:
+            return self.value_real
+        return None
+
+
+@dataclasses.dataclass(slots=True)
+class MetadataSourceRow:
+    """A detached MetadataSource; `entries` is all MergeContext needs from a source."""
+    id: int
+    source: str
+    entries: List[MetadataEntryRow]
+
+
+@dataclasses.dataclass(slots=True)
+class MediaOwnershipRow:
+    """A detached MediaOwnership with the columns generate_relative_export_path reads."""
+    owner_id: int
+    suggested_export_path: str | None
+
+
+@dataclasses.dataclass(slots=True)
+class LocationRow:
+    """A detached Location with its ownerships and a link back to its media file."""
+    id: int
+    path: str
+    filename: str
+    file_size: int
+    media_file_id: int
+    media_file: 'MediaFileRow' = dataclasses.field(default=None, repr=False, compare=False)
+    owners: List[MediaOwnershipRow] = dataclasses.field(default_factory=list)
+
+
+@dataclasses.dataclass(slots=True)
+class MediaFileRow:
+    """A detached MediaFile with all of its locations."""
+    id: int
+    mime_type: str
+    locations: List[LocationRow] = dataclasses.field(default_factory=list)
+
+
 # --- Core Functions ---
 
-def get_locations_for_owner(db: Session, owner: models.Owner) -> List[models.Location]:
-    """Queries all locations owned by a person with all necessary related data eagerly loaded."""
-    print(f"Querying files for owner: {owner.name}...")
-    return db.query(models.Location).join(
-        models.MediaOwnership
-    ).filter(
-        models.MediaOwnership.owner_id == owner.id
-    ).options(
-        selectinload(models.Location.media_file).options(
-            selectinload(models.MediaFile.locations).options(
-                selectinload(models.Location.owners),
-                selectinload(models.Location.metadata_sources).selectinload(models.MetadataSource.entries)
-            )
+# Number of ids bound into one IN (...) query when loading locations or metadata
+IN_QUERY_CHUNK_SIZE = 900
+
+
+def load_metadata_sources(db: Session, media_file_ids) -> Dict[int, List[MetadataSourceRow]]:
+    """
+    Loads the metadata of all locations of the given media files as plain rows, keyed by
+    media file id. The entries are the bulk of the exported data, so they are fetched as
+    column tuples instead of being hydrated into ORM objects and the identity map.
+    """
+    media_file_ids = list(media_file_ids)
+    sources_by_media_file: Dict[int, List[MetadataSourceRow]] = {}
+    sources_by_id: Dict[int, MetadataSourceRow] = {}
+    for i in range(0, len(media_file_ids), IN_QUERY_CHUNK_SIZE):
+        stmt = select(
+            models.Location.media_file_id,
+            models.MetadataSource.id,
+            models.MetadataSource.source,
+            models.MetadataEntry.id,
+            models.MetadataEntry.key,
+            models.MetadataEntry.value_str,
+            models.MetadataEntry.value_dt,
+            models.MetadataEntry.value_real,
+        ).join(
+            models.MetadataSource, models.MetadataSource.location_id == models.Location.id
+        ).outerjoin(
+            models.MetadataEntry, models.MetadataEntry.source_id == models.MetadataSource.id
+        ).where(
+            models.Location.media_file_id.in_(media_file_ids[i:i + IN_QUERY_CHUNK_SIZE])
+        ).order_by(models.Location.id, models.MetadataSource.id, models.MetadataEntry.id)
+
+        for media_file_id, source_id, source_name, entry_id, key, value_str, value_dt, value_real in db.execute(stmt):
+            source = sources_by_id.get(source_id)
+            if source is None:
+                source = sources_by_id[source_id] = MetadataSourceRow(source_id, source_name, [])
+                sources_by_media_file.setdefault(media_file_id, []).append(source)
+            if entry_id is None:
+                continue  # A source without any entries
+            source.entries.append(MetadataEntryRow(entry_id, key, value_str, value_dt, value_real))
+    return sources_by_media_file
+
+
+def load_locations(db: Session, location_ids) -> List[LocationRow]:
+    """
+    Loads the given locations as plain rows, in the given order. Each is linked to its
+    media file, which holds all locations of that file (candidates for the copy source)
+    with their ownerships (which carry the suggested export paths). The rows are read
+    from the export worker threads without touching the session.
+    """
+    location_ids = list(location_ids)
+    locations_by_id: Dict[int, LocationRow] = {}
+    media_files: Dict[int, MediaFileRow] = {}
+    for i in range(0, len(location_ids), IN_QUERY_CHUNK_SIZE):
+        media_file_ids = select(models.Location.media_file_id).where(
+            models.Location.id.in_(location_ids[i:i + IN_QUERY_CHUNK_SIZE])
         )
-    ).all()
+        sibling_ids = select(models.Location.id).where(models.Location.media_file_id.in_(media_file_ids))
+
+        new_media_file_ids = set()
+        for loc_id, path, filename, file_size, media_file_id, mime_type in db.execute(
+            select(
+                models.Location.id,
+                models.Location.path,
+                models.Location.filename,
+                models.Location.file_size,
+                models.Location.media_file_id,
+                models.MediaFile.mime_type,
+            ).join(
+                models.MediaFile, models.MediaFile.id == models.Location.media_file_id
+            ).where(
+                models.Location.id.in_(sibling_ids)
+            ).order_by(models.Location.id)
+        ):
+            media_file = media_files.get(media_file_id)
+            if media_file is None:
+                media_file = media_files[media_file_id] = MediaFileRow(media_file_id, mime_type)
+                new_media_file_ids.add(media_file_id)
+            elif media_file_id not in new_media_file_ids:
+                continue  # All its locations were loaded with an earlier chunk
+            location = locations_by_id[loc_id] = LocationRow(loc_id, path, filename, file_size, media_file_id, media_file)
+            media_file.locations.append(location)
+
+        for location_id, owner_id, suggested_export_path in db.execute(
+            select(
+                models.MediaOwnership.location_id,
+                models.MediaOwnership.owner_id,
+                models.MediaOwnership.suggested_export_path,
+            ).where(models.MediaOwnership.location_id.in_(sibling_ids))
+        ):
+            location = locations_by_id[location_id]
+            if location.media_file_id in new_media_file_ids:
+                location.owners.append(MediaOwnershipRow(owner_id, suggested_export_path))
+
+    return [locations_by_id[loc_id] for loc_id in location_ids if loc_id in locations_by_id]
+
+
+def _owner_locations_filter(owner: models.Owner):
+    return models.Location.id.in_(
+        select(models.MediaOwnership.location_id).where(models.MediaOwnership.owner_id == owner.id)
+    )
+
+
+def count_locations_for_owner(db: Session, owner: models.Owner) -> Tuple[int, int]:
+    """Returns the number and the total size in bytes of the locations owned by a person."""
+    count, total_size = db.execute(
+        select(func.count(models.Location.id), func.coalesce(func.sum(models.Location.file_size), 0))
+        .where(_owner_locations_filter(owner))
+    ).one()
+    return count, total_size
+
+
+def get_locations_for_owner(db: Session, owner: models.Owner) -> Iterator[List[LocationRow]]:
+    """
+    Streams all locations owned by a person in batches of CONFIG["BATCH_SIZE"], each loaded
+    with load_locations(). Metadata is loaded separately with load_metadata_sources().
+    """
+    print(f"Querying files for owner: {owner.name}...")
+    stmt = select(models.Location.id).where(
+        _owner_locations_filter(owner)
+    ).order_by(models.Location.id).execution_options(yield_per=CONFIG["BATCH_SIZE"])
+    return (load_locations(db, location_ids) for location_ids in db.scalars(stmt).partitions())
 
 
-def get_locations_by_paths(db: Session, paths: List[str]) -> List[models.Location]:
-    """Queries for specific locations based on a list of file paths."""
+def get_location_ids_by_paths(db: Session, paths: List[str]) -> Tuple[List[int], int]:
+    """
+    Resolves file paths to location ids, in id order, and returns them with the total size
+    in bytes of those locations. The paths are looked up in chunks, so long file lists stay
+    within SQLite's bound-parameter limit.
+    """
     print(f"Querying for {len(paths)} specific file paths...")
-    return db.query(models.Location).filter(
-        models.Location.path.in_(paths)
-    ).options(
-        selectinload(models.Location.media_file).options(
-            # This is the full chain to load everything needed
-            selectinload(models.MediaFile.locations).options(
-                selectinload(models.Location.owners),  # <-- ADD THIS LINE
-                selectinload(models.Location.metadata_sources).selectinload(
-                    models.MetadataSource.entries)
-            )
+    file_sizes: Dict[int, int] = {}
+    for i in range(0, len(paths), IN_QUERY_CHUNK_SIZE):
+        for loc_id, file_size in db.execute(
+            select(models.Location.id, models.Location.file_size)
+            .where(models.Location.path.in_(paths[i:i + IN_QUERY_CHUNK_SIZE]))
+        ):
+            file_sizes[loc_id] = file_size
+    return sorted(file_sizes), sum(file_sizes.values())
+
+
+def get_locations_by_ids(db: Session, location_ids: List[int]) -> Iterator[List[LocationRow]]:
+    """Loads the given locations with load_locations(), in batches of CONFIG["BATCH_SIZE"]."""
+    return (load_locations(db, location_ids[i:i + CONFIG["BATCH_SIZE"]])
+            for i in range(0, len(location_ids), CONFIG["BATCH_SIZE"]))
+
+
+def get_locations_by_paths(db: Session, paths: List[str]) -> Iterator[List[LocationRow]]:
+    """
+    Streams the locations of specific file paths in batches of CONFIG["BATCH_SIZE"]. Metadata
+    is loaded separately with load_metadata_sources().
+    """
+    location_ids, _ = get_location_ids_by_paths(db, paths)
+    return get_locations_by_ids(db, location_ids)
+
+class ExifToolDaemon:
+    """
+    A long-running `exiftool -stay_open True -@ -` process. Each command is written to
+    its stdin followed by a numbered -execute, so the Perl startup cost is paid once per
+    process instead of once per exiftool call.
+    """
+
+    def __init__(self, exiftool_path: str):
+        self.exiftool_path = exiftool_path
+        self.process = None
+        self._next_id = 1
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def start(self):
+        self.process = subprocess.Popen(
+            [self.exiftool_path, "-stay_open", "True", "-@", "-"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            text=True, encoding='utf-8',
         )
-    ).all()
+
+    @staticmethod
+    def _read_until(stream, marker: str) -> str:
+        lines = []
+        for line in stream:
+            if line.rstrip("\r\n") == marker:
+                return "".join(lines)
+            lines.append(line)
+        raise BrokenPipeError("ExifTool exited unexpectedly.")
+
+    def _write_commands(self, payload: str):
+        try:
+            self.process.stdin.write(payload)
+            self.process.stdin.flush()
+        except OSError:
+            pass  # The reader notices the dead process and raises.
+
+    def submit_many(self, commands: List[List[str]]) -> Tuple[List[str], threading.Thread]:
+        """
+        Queues several commands without waiting for them. ExifTool starts working right
+        away; pass the returned handle to collect() to wait for the (stdout, stderr) output.
+        """
+        if self.process is None or self.process.poll() is not None:
+            self.start()
+
+        # -echo4 prints the marker to stderr once a command is done, and -executeNUM
+        # prints {readyNUM} to stdout, so both streams can be read up to a known end.
+        markers = []
+        lines = []
+        for args in commands:
+            marker = f"{{ready{self._next_id}}}"
+            lines.extend(args)
+            lines.extend(["-echo4", marker, f"-execute{self._next_id}"])
+            markers.append(marker)
+            self._next_id += 1
+
+        # Write from a separate thread so a large batch cannot fill the stdin pipe while
+        # ExifTool is blocked on output that has not been read yet.
+        writer = threading.Thread(target=self._write_commands, args=("\n".join(lines) + "\n",), daemon=True)
+        writer.start()
+        return markers, writer
+
+    def collect(self, pending: Tuple[List[str], threading.Thread]) -> List[Tuple[str, str]]:
+        """Waits for commands queued with submit_many() and returns their output in order."""
+        markers, writer = pending
+        results = []
+        for marker in markers:
+            stdout = self._read_until(self.process.stdout, marker)
+            stderr = self._read_until(self.process.stderr, marker)
+            results.append((stdout, stderr))
+        writer.join()
+        return results
+
+    def execute_many(self, commands: List[List[str]]) -> List[Tuple[str, str]]:
+        """
+        Runs several commands in one round trip and returns their (stdout, stderr)
+        output in order. All commands are queued up front, so ExifTool moves straight
+        from one file to the next without waiting for this side to read the result.
+        """
+        return self.collect(self.submit_many(commands))
+
+    def execute(self, args: List[str]) -> Tuple[str, str]:
+        """Runs one command and returns its (stdout, stderr) output."""
+        return self.execute_many([args])[0]
+
+    def close(self):
+        """Asks ExifTool to exit and waits for it, so no orphaned process is left behind."""
+        if self.process is None:
+            return
+        try:
+            if self.process.poll() is None:
+                self.process.stdin.write("-stay_open\nFalse\n")
+                self.process.stdin.flush()
+                self.process.wait(timeout=10)
+        except (OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+            self.process.wait()
+        finally:
+            self.process = None
+
+
+# One ExifTool daemon per export worker thread, created on first use
+_exiftool_local = threading.local()
+_exiftool_daemons: List[ExifToolDaemon] = []
+_exiftool_daemons_lock = threading.Lock()
+
+
+def _get_exiftool_daemon() -> ExifToolDaemon:
+    daemon = getattr(_exiftool_local, "daemon", None)
+    if daemon is None:
+        daemon = ExifToolDaemon(CONFIG["EXIFTOOL_PATH"])
+        daemon.start()
+        _exiftool_local.daemon = daemon
+        with _exiftool_daemons_lock:
+            _exiftool_daemons.append(daemon)
+    return daemon
+
+
+def _close_exiftool_daemons():
+    with _exiftool_daemons_lock:
+        for daemon in _exiftool_daemons:
+            daemon.close()
+        _exiftool_daemons.clear()
+
 
 def write_metadata_batch(jobs_to_process: List[FileExportJob]):
     """
-    Writes metadata by creating new files using ExifTool. It attempts a fast
-    batch operation first and recursively falls back to smaller chunks if the
-    batch fails, efficiently isolating problematic files.
+    Writes metadata by creating new files using ExifTool. The whole batch goes to this
+    thread's persistent ExifTool daemon in one round trip, with every file as its own
+    command, so a problematic file only fails itself and no retry splitting is needed.
+    Files that need no metadata changes are copied while ExifTool works on the others.
     """
-    # --- Stage 1: Separate jobs and handle simple copies ---
-    metadata_jobs = []
-    for job in jobs_to_process:
-        # Only process jobs that are actually pending.
-        if job.status != ExportStatus.PENDING_EXPORT:
-            continue
+    # --- Stage 1: Hand all metadata jobs to the daemon in one round trip ---
+    pending_jobs = [job for job in jobs_to_process if job.status == ExportStatus.PENDING_EXPORT]
+    metadata_jobs = [job for job in pending_jobs if job.export_arguments]
+    commands = []
+    for job in metadata_jobs:
+        # Ensure destination directory exists for the operation.
+        _ensure_dir(os.path.dirname(job.final_output_path))
+        commands.append(job.get_exiftool_args_as_list() + \
+                        [
+                            '-m', # ignore minor errors
+                            '-P', # preserve file modification date
+                        ] + \
+                        (['-fast'] if CONFIG["EXIFTOOL_FAST"] else []) + \
+                        ["-o", job.final_output_path, job.source_location_to_copy.path])
+
+    daemon = None
+    submitted = None
+    submit_error = None
+    if commands:
+        daemon = _get_exiftool_daemon()
+        try:
+            submitted = daemon.submit_many(commands)
+        except OSError as e:
+            submit_error = e
 
-        if not job.export_arguments:
-            try:
-                # This is a simple file copy since there are no metadata args.
-                os.makedirs(os.path.dirname(job.final_output_path), exist_ok=True)
-                copy_file_task((job.source_location_to_copy.path, job.final_output_path))
-                job.status = ExportStatus.SUCCESS
-            except Exception as e:
-                job.status = ExportStatus.FAILED
-                job.error_message = f"File copy failed: {e}"
-        else:
-            # This job requires metadata processing.
-            metadata_jobs.append(job)
+    # --- Stage 2: Copy the files without metadata args while ExifTool works ---
+    # Only these unchanged exports may be hard linked; every other copy must stay independent
+    copy = _link_or_copyfile if CONFIG["HARDLINK"] else _fast_copyfile
+    for job in pending_jobs:
+        if job.export_arguments:
+            continue
+        try:
+            # This is a simple file copy since there are no metadata args.
+            _ensure_dir(os.path.dirname(job.final_output_path))
+            copy_file_task((job.source_location_to_copy.path, job.final_output_path), copy)
+            job.status = ExportStatus.SUCCESS
+        except Exception as e:
+            job.status = ExportStatus.FAILED
+            job.error_message = f"File copy failed: {e}"
 
-    # --- Base Cases for Recursion ---
     if not metadata_jobs:
         return  # No metadata jobs to process.
 
-    if len(metadata_jobs) == 1:
-        job = metadata_jobs[0]
-        # Ensure destination directory exists for the single operation.
-        os.makedirs(os.path.dirname(job.final_output_path), exist_ok=True)
-
-        final_individual_args = [CONFIG["EXIFTOOL_PATH"]] + job.get_exiftool_args_as_list() + \
-                                [
-                                    '-m', # ignore minor errors
-                                    '-P', # preserve file modification date
-                                ] + \
-                                ["-o", job.final_output_path, job.source_location_to_copy.path]
-        try:
-            subprocess.run(final_individual_args, check=True, capture_output=True, text=True, encoding='utf-8')
+    # --- Stage 3: Collect the ExifTool results ---
+    try:
+        if submit_error is not None:
+            raise submit_error
+        results = daemon.collect(submitted)
+    except OSError as e:
+        # The daemon died; it is restarted on the next call. Files written before the
+        # crash are still picked up by the output check below.
+        daemon.close()
+        results = [("", f"ExifTool process failed: {e}")] * len(metadata_jobs)
+
+    for job, (_, stderr) in zip(metadata_jobs, results):
+        # A command can report success without writing the file, so verify the output.
+        if os.path.exists(job.final_output_path):
             job.status = ExportStatus.SUCCESS
-        except subprocess.CalledProcessError as e:
+        else:
             job.status = ExportStatus.FAILED
-            job.error_message = e.stderr.strip()
-        return
+            job.error_message = stderr.strip() or "ExifTool did not create the output file."
 
-    # --- Recursive Step: Attempt Batch Processing ---
-    base_args = [
-        "-common_args",
-        "-m",  # ignore minor errors
-        "-P",  # preserve file modification date
-    ]
-    command_args = []
-    for job in metadata_jobs:
-        command_args.extend(job.get_exiftool_args_as_list())
-        command_args.extend(["-o", job.final_output_path, job.source_location_to_copy.path])
-        command_args.append("-execute")
+# errno values with which os.copy_file_range reports that it cannot handle this pair of
+# files (old kernel, cross-filesystem copy, unsupported filesystem); copy normally then
+_COPY_FILE_RANGE_UNSUPPORTED = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP}
 
-    final_batch_args = base_args + command_args[:-1]  # Remove the last '-execute'
-    argfile_path = None
+# ioctl request of FICLONE (linux/fs.h), and the errno values with which it reports that
+# the files cannot be cloned (different filesystems, no reflink support)
+_FICLONE = 0x40049409
+_FICLONE_UNSUPPORTED = {errno.EXDEV, errno.EOPNOTSUPP, errno.EINVAL, errno.ENOTTY, errno.ENOSYS, errno.EPERM}
+
+
+def _kernel_copyfile(src: str, dst: str) -> bool:
+    """
+    Copies the contents of src to dst inside the kernel: first as a reflink clone (FICLONE,
+    with CONFIG["ALLOW_REFLINK"]), which on copy-on-write filesystems (Btrfs, XFS) shares
+    the data blocks instead of copying them, else with os.copy_file_range. Returns False
+    if this pair of files cannot be copied either way.
+    """
+    if not hasattr(os, "copy_file_range"):
+        return False
     try:
-        with tempfile.NamedTemporaryFile(mode='w+', delete=False, encoding='utf-8', suffix=".txt") as argfile:
-            argfile_path = argfile.name
-            argfile.write("\n".join(final_batch_args))
-
-        final_command = [CONFIG["EXIFTOOL_PATH"], "-@", argfile_path]
-        subprocess.run(final_command, check=True, capture_output=True, text=True, encoding='utf-8')
-
-        # Post-Batch Verification: A 0 exit code doesn't guarantee all files were created.
-        remaining_jobs = []
-        for job in metadata_jobs:
-            if os.path.exists(job.final_output_path):
-                job.status = ExportStatus.SUCCESS
-            else:
-                job.error_message = "Exiftool batch succeeded but did not create the output file."
-                remaining_jobs.append(job)
-
-        if remaining_jobs:
-            print(f"\nBatch finished, but {len(remaining_jobs)} files were not created. Retrying them recursively.")
-            write_metadata_batch(remaining_jobs)
-
-    except subprocess.CalledProcessError:
-        # Batch failed. Check for any partially successful files before recursing.
-        remaining_jobs = []
-        for job in metadata_jobs:
-            if os.path.exists(job.final_output_path):
-                job.status = ExportStatus.SUCCESS
-            else:
-                remaining_jobs.append(job)
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            if CONFIG["ALLOW_REFLINK"] and fcntl is not None:
+                try:
+                    fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+                    return True
+                except OSError as e:
+                    if e.errno not in _FICLONE_UNSUPPORTED:
+                        raise
+
+            # A size of 0 can also mean "unknown" (e.g. special files); copy those normally
+            size = remaining = os.fstat(fsrc.fileno()).st_size
+            while remaining > 0:
+                copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), min(remaining, 1 << 30))
+                if copied == 0:
+                    break
+                remaining -= copied
+    except OSError as e:
+        if e.errno not in _COPY_FILE_RANGE_UNSUPPORTED:
+            raise
+        return False
+    return bool(size) and remaining == 0
+
+
+def _fast_copyfile(src: str, dst: str):
+    """
+    Copies src to dst like shutil.copy2, but cloned or with os.copy_file_range where
+    available (Linux). Otherwise shutil.copyfile is used, which uses sendfile on Linux. The
+    timestamps and permission bits of src are kept, as ExifTool's -P does for written files.
+    """
+    if not _kernel_copyfile(src, dst):
+        shutil.copyfile(src, dst)
+    shutil.copystat(src, dst)
 
-        if not remaining_jobs:
-            return  # All files were processed successfully before the error was thrown.
 
-        # Only print the message for larger batches to avoid clutter.
-        if len(remaining_jobs) > 1:
-            print(
-                f"\nExifTool batch of {len(metadata_jobs)} failed. {len(remaining_jobs)} file(s) did not process. Splitting and retrying.")
+def _prefetch_files(paths: List[str]):
+    """
+    Asks the kernel to start reading the given files into the page cache in the background
+    (POSIX_FADV_WILLNEED), so their reads overlap with the work on earlier files of the
+    batch instead of starting cold. Does nothing where posix_fadvise is unavailable.
+    """
+    if not hasattr(os, "posix_fadvise"):
+        return
+    for path in paths:
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            continue  # The copy or ExifTool reports the problem
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
 
-        midpoint = len(remaining_jobs) // 2
-        write_metadata_batch(remaining_jobs[:midpoint])
-        write_metadata_batch(remaining_jobs[midpoint:])
 
-    finally:
-        if argfile_path and os.path.exists(argfile_path):
-            os.remove(argfile_path)
+# errno values with which os.link reports that src and dst cannot be linked (different
+# filesystems, no hard link support, link limit reached); copy instead
+_LINK_UNSUPPORTED = {errno.EXDEV, errno.EPERM, errno.EMLINK, errno.EOPNOTSUPP}
 
-def copy_file_task(src_dst_tuple: Tuple[str, str]):
+
+def _link_or_copyfile(src: str, dst: str):
+    """Hard links dst to src, or copies the file if they cannot be linked."""
+    try:
+        os.link(src, dst)
+    except OSError as e:
+        if e.errno not in _LINK_UNSUPPORTED:
+            raise
+        _fast_copyfile(src, dst)
+
+
+def copy_file_task(src_dst_tuple: Tuple[str, str], copy: Callable[[str, str], None] = _fast_copyfile):
     """
-    Simple wrapper for shutil.copyfile with a retry mechanism for file locks.
+    Simple wrapper for _fast_copyfile (or the given copy function) with a retry mechanism
+    for file locks.
     """
     src, dst = src_dst_tuple
     retries = 3
@@ -219,7 +595,7 @@ def copy_file_task(src_dst_tuple: Tuple[str, str]):
 
     for attempt in range(retries):
         try:
-            shutil.copyfile(src, dst)
+            copy(src, dst)
             return src, None  # Success!
         except OSError as e:
             # On Windows, error 32 is "The process cannot access the file..."
@@ -250,13 +626,29 @@ def log_conflict(logger: logging.Logger, file_path: str, conflicts: Dict[str, Li
     details_str = "\n    ".join(conflict_lines)
     logger.warning(f"{file_path}\n    {details_str}")
 
-def _get_best_location(locations: List[models.Location]) -> models.Location:
+def _get_best_location(locations: List[LocationRow]) -> LocationRow:
     """Selects the best location from a list based on largest file size, with ID as a tie-breaker."""
     if not locations:
         raise ValueError("Cannot select best location from an empty list.")
-    return sorted(locations, key=lambda l: (-l.file_size, l.id))[0]
-
-def generate_relative_export_path(media_file: models.MediaFile, export_arguments: List[ExportArgument], owner: models.Owner) -> Tuple[str, models.Location]:
+    return min(locations, key=lambda l: (-l.file_size, l.id))
+
+# --- Folder Hierarchy Rules ---
+# (lowercase substring of a '/'-separated path, target subdirectory), in priority order
+WHATSAPP_PATH_RULES = [
+    ('whatsapp images/sent', os.path.join("Whatsapp Images", "Sent")),
+    ('whatsapp video/sent', os.path.join("Whatsapp Video", "Sent")),
+    ('whatsapp images', "Whatsapp Images"),
+    ('whatsapp video', "Whatsapp Video"),
+]
+GENERAL_PATH_RULES = [
+    # ('dcim/camera', "Camera"),
+    ('screenshots', "Screenshots"),
+]
+WHATSAPP_FILENAME_PATTERN = re.compile(r'-WA\d{4}', re.IGNORECASE)
+SCREENSHOT_FILENAME_PATTERN = re.compile(r'screenshot', re.IGNORECASE)
+
+
+def generate_relative_export_path(media_file: MediaFileRow, export_arguments: List[ExportArgument], owner: models.Owner) -> Tuple[str, LocationRow]:
     """
     Generates the full relative export path for a media file based on a prioritized
     set of rules, falling back to a year-based structure using the merged metadata.
@@ -281,15 +673,6 @@ def generate_relative_export_path(media_file: models.MediaFile, export_arguments
         best_overall_location = _get_best_location(media_file.locations)
         return os.path.join(target_subdir, best_overall_location.filename), best_overall_location
 
-    # --- Define Folder Hierarchy Rules ---
-    priority_rules = [
-        ('whatsapp images/sent', os.path.join("Whatsapp Images", "Sent")),
-        ('whatsapp video/sent', os.path.join("Whatsapp Video", "Sent")),
-        ('whatsapp images', "Whatsapp Images"),
-        ('whatsapp video', "Whatsapp Video"),
-    ]
-    whatsapp_filename_pattern = re.compile(r'-WA\d{4}', re.IGNORECASE)
-
     # --- Priority 2: Owner-Specific WhatsApp Logic ---
     owner_locations = [loc for loc in media_file.locations if any(mo.owner_id == owner.id for mo in loc.owners)]
 
@@ -299,13 +682,15 @@ def generate_relative_export_path(media_file: models.MediaFile, export_arguments
         is_whatsapp = False
         target_subdir = ""
 
-        for pattern, subdir in priority_rules:
-            if pattern in path_lower:
-                is_whatsapp = True
-                target_subdir = subdir
-                break
+        # Every WhatsApp rule contains 'whatsapp', so most paths are ruled out in one scan
+        if 'whatsapp' in path_lower:
+            for pattern, subdir in WHATSAPP_PATH_RULES:
+                if pattern in path_lower:
+                    is_whatsapp = True
+                    target_subdir = subdir
+                    break
 
-        if not is_whatsapp and whatsapp_filename_pattern.search(loc.filename):
+        if not is_whatsapp and WHATSAPP_FILENAME_PATTERN.search(loc.filename):
             is_whatsapp = True
             target_subdir = "Whatsapp Video" if media_file.mime_type.startswith('video/') else "Whatsapp Images"
 
@@ -316,19 +701,15 @@ def generate_relative_export_path(media_file: models.MediaFile, export_arguments
             return relative_path, source_location
 
     # --- Priority 3: General Rules (Non-WhatsApp) using ALL locations ---
-    general_rules = [
-        # ('dcim/camera', "Camera"),
-        ('screenshots', "Screenshots"),
-    ]
     all_paths = [loc.path.lower().replace('\\', '/') for loc in media_file.locations]
     best_overall_location = _get_best_location(media_file.locations)
 
-    for pattern, target_subdir in general_rules:
+    for pattern, target_subdir in GENERAL_PATH_RULES:
         for path in all_paths:
             if pattern in path:
                 return os.path.join(target_subdir, best_overall_location.filename), best_overall_location
 
-    if re.search(r'screenshot', best_overall_location.filename, re.IGNORECASE):
+    if SCREENSHOT_FILENAME_PATTERN.search(best_overall_location.filename):
         return os.path.join("Screenshots", best_overall_location.filename), best_overall_location
 
     # --- Priority 4: Default to Year-Based Pathing using Merged Date ---
@@ -349,56 +730,84 @@ def generate_relative_export_path(media_file: models.MediaFile, export_arguments
 
     return os.path.join(year_str, best_overall_location.filename), best_overall_location
 
+# Destination directories already created (or found) during this export
+_created_dirs: set = set()
+
+
+def _ensure_dir(directory: str):
+    """os.makedirs(directory, exist_ok=True), skipped for directories already ensured."""
+    if directory not in _created_dirs:
+        os.makedirs(directory, exist_ok=True)
+        _created_dirs.add(directory)
+
+
+# Names already present (or handed out) per destination directory. Each directory is
+# read with one os.scandir instead of an os.path.exists call per candidate path.
+_existing_names: Dict[str, set] = {}
+_existing_names_lock = threading.Lock()
+
+# macOS and Windows filesystems are case-insensitive by default, so names are compared
+# casefolded there. Elsewhere 'IMG.jpg' and 'img.jpg' are different files.
+_CASE_INSENSITIVE_FS = sys.platform in ("darwin", "win32")
+
+
+def _name_key(filename: str) -> str:
+    """Returns the key under which a filename is tracked in _existing_names."""
+    return filename.casefold() if _CASE_INSENSITIVE_FS else filename
+
+
 def find_unique_filepath(destination_path: str) -> str:
     """
     Checks if a file exists at the destination. If so, it appends a number
-    like '-[1]' to the filename until a unique path is found.
+    like '-[1]' to the filename until a unique path is found. The returned path is
+    reserved, so concurrent export workers never pick the same one.
     """
-    if not os.path.exists(destination_path):
-        return destination_path  # The original path is already unique
+    directory, filename = os.path.split(destination_path)
+
+    with _existing_names_lock:
+        names = _existing_names.get(directory)
+        if names is None:
+            try:
+                with os.scandir(directory) as it:
+                    names = {_name_key(entry.name) for entry in it}
+            except (FileNotFoundError, NotADirectoryError):
+                names = set()
+            _existing_names[directory] = names
 
-    directory = os.path.dirname(destination_path)
-    filename = os.path.basename(destination_path)
-    base_name, extension = os.path.splitext(filename)
+        if _name_key(filename) not in names:
+            names.add(_name_key(filename))
+            return destination_path  # The original path is already unique
 
-    counter = 1
-    while True:
-        # Create a new filename, e.g., "my_photo-[1].jpg"
-        new_filename = f"{base_name}-[{counter}]{extension}"
-        new_path = os.path.join(directory, new_filename)
+        base_name, extension = os.path.splitext(filename)
 
-        if not os.path.exists(new_path):
-            return new_path  # Found a unique path
+        counter = 1
+        while True:
+            # Create a new filename, e.g., "my_photo-[1].jpg"
+            new_filename = f"{base_name}-[{counter}]{extension}"
 
-        counter += 1
+            if _name_key(new_filename) not in names:
+                names.add(_name_key(new_filename))
+                return os.path.join(directory, new_filename)  # Found a unique path
+
+            counter += 1
 
 
 # In export_pipe.py
 
 def _prepare_export_jobs(
-        locations: List[models.Location],
+        locations: List[LocationRow],
+        sources_by_media_file: Dict[int, List[MetadataSourceRow]],
         pipeline: MergePipeline,
         owner: models.Owner,
         export_dir: str,
-        processed_media_ids: set,
-        processed_ids_lock: threading.Lock
 ) -> List[FileExportJob]:
     """
     Runs the merge pipeline for each location and creates a FileExportJob object.
-    This step identifies conflicts and files to be skipped.
+    This step identifies conflicts. The locations are already one per media file.
     """
     jobs = []
     for loc in locations:
-        with processed_ids_lock:
-            if loc.media_file.id in processed_media_ids:
-                job = FileExportJob(loc.media_file, loc, [], "", status=ExportStatus.SKIPPED)
-                jobs.append(job)
-                continue # Continue inside the lock to ensure it's released
-
-            processed_media_ids.add(loc.media_file.id)
-
-
-        all_sources_for_file = [s for l in loc.media_file.locations for s in l.metadata_sources]
+        all_sources_for_file = sources_by_media_file.get(loc.media_file.id, [])
 
         final_arguments = []
         result_context = None
@@ -416,7 +825,7 @@ def _prepare_export_jobs(
         job = FileExportJob(loc.media_file, source_loc_to_copy, final_arguments, relative_path)
 
         # Check for merge conflicts
-        if result_context.conflicts:
+        if result_context is not None and result_context.conflicts:
             job.status = ExportStatus.CONFLICT
             job.error_message = str(result_context.conflicts)  # Store conflicts as the error
 
@@ -430,8 +839,8 @@ def _handle_failed_job(job: FileExportJob, failed_dir: str):
         # The file was never copied to the export dir, so we copy the original source
         failure_path = os.path.join(failed_dir, job.relative_path)
         unique_failure_path = find_unique_filepath(failure_path)
-        os.makedirs(os.path.dirname(unique_failure_path), exist_ok=True)
-        shutil.copyfile(job.source_location_to_copy.path, unique_failure_path)
+        _ensure_dir(os.path.dirname(unique_failure_path))
+        _fast_copyfile(job.source_location_to_copy.path, unique_failure_path)
 
         # Create the arguments log file
         args_log_path = os.path.splitext(unique_failure_path)[0] + ".txt"
@@ -447,16 +856,15 @@ def _handle_failed_job(job: FileExportJob, failed_dir: str):
 
 
 def process_export_batch(
-        batch_locations: List[models.Location],
+        batch_locations: List[LocationRow],
+        sources_by_media_file: Dict[int, List[MetadataSourceRow]],
         export_dir: str,
         conflict_dir: str,
         failed_dir: str,
         logger: logging.Logger,
         conflict_fp,
         pipeline: MergePipeline,
-        processed_media_ids: set,
         owner: models.Owner,
-        processed_ids_lock: threading.Lock,
         conflict_fp_lock: threading.Lock
 ) -> Tuple[Dict[str, int], int]:
     """
@@ -464,19 +872,23 @@ def process_export_batch(
     Returns a dictionary of stats.
     """
     # 1. Prepare job objects for all files in the batch
-    jobs = _prepare_export_jobs(batch_locations, pipeline, owner, export_dir, processed_media_ids, processed_ids_lock)
+    jobs = _prepare_export_jobs(batch_locations, sources_by_media_file, pipeline, owner, export_dir)
+    _prefetch_files([j.source_location_to_copy.path for j in jobs])
 
     # 2. Handle conflicts: log them and copy to conflict_dir
     conflicted_jobs = [j for j in jobs if j.status == ExportStatus.CONFLICT]
-    for job in conflicted_jobs:
-        log_conflict(logger, job.source_location_to_copy.path, eval(job.error_message))
+    if conflicted_jobs:
+        # One write and flush for the whole batch's conflict paths
         with conflict_fp_lock:
-            conflict_fp.write(f"{job.source_location_to_copy.path}\n")
+            conflict_fp.write("".join(f"{job.source_location_to_copy.path}\n" for job in conflicted_jobs))
             conflict_fp.flush()
 
+    for job in conflicted_jobs:
+        log_conflict(logger, job.source_location_to_copy.path, eval(job.error_message))
+
         conflict_path = os.path.join(conflict_dir, job.relative_path)
         unique_conflict_path = find_unique_filepath(conflict_path)
-        os.makedirs(os.path.dirname(unique_conflict_path), exist_ok=True)
+        _ensure_dir(os.path.dirname(unique_conflict_path))
         copy_file_task((job.source_location_to_copy.path, unique_conflict_path))
 
     # 3. Handle pending exports: Calculate final paths and run batch exiftool command
@@ -486,7 +898,7 @@ def process_export_batch(
     for job in jobs_to_export:
         initial_path = os.path.join(export_dir, job.relative_path)
         job.final_output_path = find_unique_filepath(initial_path)
-        os.makedirs(os.path.dirname(job.final_output_path), exist_ok=True)
+        _ensure_dir(os.path.dirname(job.final_output_path))
 
     # Batch write metadata. This function now handles the copy as well.
     if jobs_to_export:
@@ -515,7 +927,11 @@ def export_main(owner_name: str, export_dir: str, filelist_path: str = None):
         return
 
     print("Initializing...")
+    models.ensure_indexes(engine)
     os.makedirs(export_dir, exist_ok=True)
+    # Start from what is on disk now, not from a previous export in this process
+    _existing_names.clear()
+    _created_dirs.clear()
 
     conflict_dir = os.path.join(export_dir, "conflicted_files_for_review")
     os.makedirs(conflict_dir, exist_ok=True)
@@ -539,73 +955,110 @@ def export_main(owner_name: str, export_dir: str, filelist_path: str = None):
     fh.setLevel(logging.WARNING)
     formatter = logging.Formatter('%(asctime)s - FILE: %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
     fh.setFormatter(formatter)
-    conflict_logger.addHandler(fh)
+    # The workers only enqueue records; a listener thread does the file writes
+    conflict_log_queue = queue.SimpleQueue()
+    conflict_queue_handler = logging.handlers.QueueHandler(conflict_log_queue)
+    conflict_logger.addHandler(conflict_queue_handler)
+    conflict_log_listener = logging.handlers.QueueListener(conflict_log_queue, fh)
+    conflict_log_listener.start()
 
     total_stats = {"exported": 0, "skipped": 0, "conflicts": 0, "failed": 0}
-    processed_media_ids = set()
+    # Media files already handed to a worker; each is exported from its first location
+    submitted_media_ids = set()
 
 
     export_merge_pipeline = MergePipeline.get_default_pipeline()
 
-    processed_ids_lock = threading.Lock()
     conflict_fp_lock = threading.Lock()
 
     try:
         with SessionLocal() as db, open(conflict_paths_file, 'w', encoding='utf-8') as conflict_fp:
 
-            owner = db.query(models.Owner).filter(models.Owner.name == owner_name).first()
+            owner = db.execute(
+                select(models.Owner.id, models.Owner.name).where(models.Owner.name == owner_name)
+            ).first()
             if not owner:
                 print(f"❌ ERROR: Owner '{owner_name}' not found in the database.")
                 return
 
-            locations_to_export = []
             if filelist_path:
                 print(f"Reading file list from: {filelist_path}")
                 with open(filelist_path, 'r', encoding='utf-8') as f:
                     paths = [line.strip() for line in f if line.strip()]
-                    print(paths)
-                locations_to_export = get_locations_by_paths(db, paths)
-            elif owner_name:
-                locations_to_export = get_locations_for_owner(db, owner)
+                location_ids, total_size_bytes = get_location_ids_by_paths(db, paths)
+                total_files = len(location_ids)
+                batches = get_locations_by_ids(db, location_ids)
+            else:
+                total_files, total_size_bytes = count_locations_for_owner(db, owner)
+                batches = get_locations_for_owner(db, owner)
 
-            if not locations_to_export:
+            if not total_files:
                 print("No files found to process.")
                 return
 
-            total_size_bytes = sum(loc.file_size for loc in locations_to_export)
-            total_files = len(locations_to_export)
             print(f"Found {total_files} files to process for export ({total_size_bytes / (1024 ** 3):.2f} GB).")
 
             with ThreadPoolExecutor(max_workers=CONFIG["MAX_WORKERS"]) as executor, \
-                 tqdm(total=total_size_bytes, desc="Exporting Media", unit="B", unit_scale=True, unit_divisor=1024) as pbar:
-
-                futures = []
-                # Submit all batches to the thread pool
-                for i in range(0, total_files, CONFIG["BATCH_SIZE"]):
-                    batch = locations_to_export[i:i + CONFIG["BATCH_SIZE"]]
+                 tqdm(total=total_size_bytes, desc="Exporting Media", unit="B", unit_scale=True, unit_divisor=1024,
+                      mininterval=0.5) as pbar:
+
+                def collect(done):
+                    for future in done:
+                        try:
+                            stats, processed_bytes = future.result()
+                            # Update totals and progress bar
+                            for key in total_stats:
+                                total_stats[key] += stats[key]
+                            # refresh=False: the postfix is drawn by update(), at most every mininterval
+                            pbar.set_postfix(exported=total_stats['exported'], skipped=total_stats['skipped'],
+                                             conflicts=total_stats['conflicts'], failed=total_stats['failed'],
+                                             refresh=False)
+                            pbar.update(processed_bytes)
+                        except Exception as e:
+                            print(f"\nCRITICAL ERROR in worker thread: {e}")
+
+                pending = set()
+                # Batches are fetched while the workers export, so only the batches in flight
+                # are held in memory. Loaded objects are released once their batch is done.
+                for batch in batches:
+                    # Other locations of an already submitted media file are skipped here,
+                    # before their metadata is loaded or merged
+                    unique_batch = []
+                    for loc in batch:
+                        if loc.media_file_id in submitted_media_ids:
+                            total_stats["skipped"] += 1
+                            pbar.update(loc.file_size)
+                        else:
+                            submitted_media_ids.add(loc.media_file_id)
+                            unique_batch.append(loc)
+                    if not unique_batch:
+                        continue
+
+                    sources_by_media_file = load_metadata_sources(db, {loc.media_file_id for loc in unique_batch})
                     # Submit the job and pass the required locks
-                    future = executor.submit(
+                    pending.add(executor.submit(
                         process_export_batch,
-                        batch, export_dir, conflict_dir, failed_dir,
+                        unique_batch, sources_by_media_file, export_dir, conflict_dir, failed_dir,
                         conflict_logger, conflict_fp, export_merge_pipeline,
-                        processed_media_ids, owner,
-                        processed_ids_lock, conflict_fp_lock
-                    )
-                    futures.append(future)
-
-                # Process results as they are completed
-                for future in as_completed(futures):
-                    try:
-                        stats, processed_bytes = future.result()
-                        # Update totals and progress bar
-                        for key in total_stats:
-                            total_stats[key] += stats[key]
-                        pbar.update(processed_bytes)
-                        pbar.set_postfix(exported=total_stats['exported'], skipped=total_stats['skipped'],
-                                         conflicts=total_stats['conflicts'], failed=total_stats['failed'])
-                    except Exception as e:
-                        print(f"\nCRITICAL ERROR in worker thread: {e}")
+                        owner, conflict_fp_lock
+                    ))
+                    if len(pending) >= CONFIG["MAX_PENDING_BATCHES"]:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        collect(done)
+
+                # Everything is loaded; end the read transaction and release the connection
+                # while the last batches finish. The workers only use the plain rows.
+                db.close()
+
+                # Process the remaining results as they are completed
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
     finally:
+        _close_exiftool_daemons()
+        conflict_logger.removeHandler(conflict_queue_handler)
+        conflict_log_listener.stop()
+        fh.close()
         print("\n--- Export Complete ---")
         print(f"✅ Successfully exported {total_stats['exported']} new files.")
         print(f"⏩ Skipped {total_stats['skipped']}.")
@@ -630,10 +1083,15 @@ if __name__ == "__main__":
     parser.add_argument("--owner", type=str, help="The name of the owner whose files to export.", required=True)
     parser.add_argument("--filelist", "-f", type=str,
                         help="Optional path to a file with absolute file paths to export.")
+    parser.add_argument("--hardlink", action="store_true",
+                        help="Hard link files that need no metadata changes instead of copying them "
+                             "(same filesystem only). Editing such an exported file also edits the original.")
 
     args = parser.parse_args()
 
     if not args.owner and not args.filelist:
         parser.error("Either an --owner or the --filelist argument must be provided.")
 
+    CONFIG["HARDLINK"] = args.hardlink
+
     export_main(args.owner, args.export_dir, args.filelist)
\ No newline at end of file
@@ -5,6 +5,7 @@ from concurrent.futures import ProcessPoolExecutor, as_completed
 from typing import List, Dict
 
 from tqdm import tqdm
+from sqlalchemy import text
 from sqlalchemy.orm import Session
 from photoprocessor.processor import PhotoProcessor
 from photoprocessor.database import engine, SessionLocal
@@ -13,6 +14,8 @@ from photoprocessor import models
 # --- Configuration ---
 CONFIG = {
     "BATCH_SIZE": 100,
+    # Number of saved files after which the import transaction is committed
+    "COMMIT_EVERY": 2000,
     "MEDIA_EXTENSIONS": (
         '.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.heic', '.webp', '.dng',
         '.mp4', '.mov', '.avi', '.mkv', '.flv', '.wmv'
@@ -59,12 +62,17 @@ def save_batch_to_db(db: Session, owner: models.Owner, batch_data: Dict) -> (Dic
     abs_paths = [os.path.abspath(p) for p in batch_data.keys()]
     existing_locations = {loc.path: loc for loc in
                           db.query(models.Location).filter(models.Location.path.in_(abs_paths))}
+    # Existing locations this owner already owns, so ownership is checked with a set
+    # lookup instead of lazy-loading every location's owners
+    owned_location_ids = {loc_id for (loc_id,) in db.query(models.MediaOwnership.location_id).filter(
+        models.MediaOwnership.owner_id == owner.id,
+        models.MediaOwnership.location_id.in_([loc.id for loc in existing_locations.values()])
+    )}
     hashes_to_check = {item["media_file"]["file_hash"] for item in batch_data.values()}
     existing_media_files = {mf.file_hash: mf for mf in
                             db.query(models.MediaFile).filter(models.MediaFile.file_hash.in_(hashes_to_check))}
 
-    for path, data in batch_data.items():
-        abs_path = os.path.abspath(path)
+    for (path, data), abs_path in zip(batch_data.items(), abs_paths):
         try:
             with db.begin_nested():
                 current_hash = data["media_file"]["file_hash"]
@@ -91,8 +99,10 @@ def save_batch_to_db(db: Session, owner: models.Owner, batch_data: Dict) -> (Dic
                         raise ValueError(
                             f"Hash conflict: path points to a different file. Old: {location_obj.media_file.file_hash}, New: {current_hash}")
 
-                if owner not in [own.owner for own in location_obj.owners]:
+                if location_obj.id is None or location_obj.id not in owned_location_ids:
                     db.add(models.MediaOwnership(owner=owner, location=location_obj))
+                    if location_obj.id is not None:
+                        owned_location_ids.add(location_obj.id)
 
                 def clear_metadata():
                     db.query(models.MetadataSource).filter_by(
@@ -125,7 +135,8 @@ def save_batch_to_db(db: Session, owner: models.Owner, batch_data: Dict) -> (Dic
 
 
         except Exception as e:
-            db.rollback()
+            # begin_nested() has already rolled back this file's savepoint; the rest of
+            # the (still uncommitted) transaction is kept.
             stats["conflicts"] += 1
             failures.append({"path": path, "error": f"Database error: {e}"})
 
@@ -135,6 +146,7 @@ def save_batch_to_db(db: Session, owner: models.Owner, batch_data: Dict) -> (Dic
 def main(owner_name: str, takeout_dir: str = None, filelist_path: str = None, custom_ext: str = None):
     print("Initializing...")
     models.Base.metadata.create_all(bind=engine)
+    models.ensure_indexes(engine)
 
     # --- Set up failure logger ---
     failure_log_path = 'import_failures.log'
@@ -162,6 +174,8 @@ def main(owner_name: str, takeout_dir: str = None, filelist_path: str = None, cu
     chunks = [all_paths[i:i + CONFIG["BATCH_SIZE"]] for i in range(0, total_files, CONFIG["BATCH_SIZE"])]
 
     total_stats = {"inserted": 0, "updated": 0, "conflicts": 0, "failures": 0}
+    # Files saved since the last commit; batches are grouped into one transaction
+    uncommitted = 0
 
     with tqdm(total=total_files, desc="Importing Media", unit="file") as pbar:
         with ProcessPoolExecutor() as executor, SessionLocal() as db:
@@ -182,7 +196,10 @@ def main(owner_name: str, takeout_dir: str = None, filelist_path: str = None, cu
                     # Save successes to the database
                     if success_data:
                         db_stats, db_failures = save_batch_to_db(db, owner, success_data)
-                        db.commit()
+                        uncommitted += len(success_data)
+                        if uncommitted >= CONFIG["COMMIT_EVERY"]:
+                            db.commit()
+                            uncommitted = 0
 
                         # Log failures from the database operation
                         for failure in db_failures:
@@ -193,14 +210,21 @@ def main(owner_name: str, takeout_dir: str = None, filelist_path: str = None, cu
                         total_stats["failures"] += len(db_failures)
 
                     # Update progress bar by the number of files in the processed chunk
-                    pbar.update(len(success_data) + len(process_failures))
+                    # Redrawn by update() below, which tqdm throttles
                     pbar.set_postfix(inserted=total_stats['inserted'], updated=total_stats['updated'],
-                                     failed=total_stats['failures'])
+                                     failed=total_stats['failures'], refresh=False)
+                    pbar.update(len(success_data) + len(process_failures))
 
                 except Exception as e:
                     # Catch unexpected errors from the worker process itself
                     logging.error(f"A worker process failed catastrophically: {e}")
 
+            # Commit whatever is left from the last batches
+            db.commit()
+            # Refresh the planner statistics so SQLite picks the selective index
+            # (e.g. ix_locations_parent_dir) for the prefix queries in the other scripts
+            db.execute(text("PRAGMA optimize"))
+
     print("\n--- Import Complete ---")
     print(f"✅ Inserted {total_stats['inserted']} new file locations.")
     print(f"🔄 Scanned/updated {total_stats['updated']} existing file locations.")
@@ -7,16 +7,14 @@ from tqdm import tqdm
 from photoprocessor import models
 from photoprocessor.database import SessionLocal
 from photoprocessor.merger import MergePipeline
-from photoprocessor.export_pipe import get_locations_for_owner, get_locations_by_paths, log_conflict
-
-# Configuration (can be smaller as it's not I/O intensive)
-CONFIG = {
-    "BATCH_SIZE": 250,
-}
+from photoprocessor.export_pipe import get_locations_for_owner, count_locations_for_owner, \
+    get_location_ids_by_paths, get_locations_by_ids, load_metadata_sources, log_conflict, \
+    LocationRow, MetadataSourceRow
 
 
 def process_test_batch(
-        batch_locations: List[models.Location],
+        batch_locations: List[LocationRow],
+        sources_by_media_file: Dict[int, List[MetadataSourceRow]],
         logger: logging.Logger,
         conflict_fp,
         merged_fp,
@@ -37,7 +35,7 @@ def process_test_batch(
 
         processed_media_files.add(media_file_id)
         stats["scanned"] += 1
-        metadata_sources = loc.media_file.all_metadata_sources
+        metadata_sources = sources_by_media_file.get(media_file_id)
         if not metadata_sources:
             continue
 
@@ -65,6 +63,7 @@ def process_test_batch(
 def merge_tester_main(owner_name: str, filelist_path: str = None):
     """Main function to orchestrate the merge testing process."""
     print("Initializing Merge Tester (Dry Run)...")
+    models.ensure_indexes()
 
     # --- Setup logging, same as export_pipe.py ---
     output_dir = "merge_test_results"
@@ -93,35 +92,38 @@ def merge_tester_main(owner_name: str, filelist_path: str = None):
     try:
         with SessionLocal() as db, open(conflict_paths_file, 'w', encoding='utf-8') as conflict_fp, open(merged_paths_file, 'w', encoding='utf-8') as merged_fp:
             # --- Use the exact same query logic from export_pipe.py ---
-            locations_to_test = []
             if filelist_path:
                 with open(filelist_path, 'r', encoding='utf-8') as f:
                     paths = [line.strip() for line in f if line.strip()]
-                locations_to_test = get_locations_by_paths(db, paths)
-            elif owner_name:
+                location_ids, _ = get_location_ids_by_paths(db, paths)
+                total_files = len(location_ids)
+                batches = get_locations_by_ids(db, location_ids)
+            else:
                 owner = db.query(models.Owner).filter(models.Owner.name == owner_name).first()
                 if not owner:
                     raise ValueError(f"Owner '{owner_name}' not found.")
-                locations_to_test = get_locations_for_owner(db, owner)
+                total_files, _ = count_locations_for_owner(db, owner)
+                batches = get_locations_for_owner(db, owner)
 
-            if not locations_to_test:
+            if not total_files:
                 print("No files found to test.")
                 return
 
-            total_files = len(locations_to_test)
             print(f"Found {total_files} files to test for merge conflicts.")
 
             with tqdm(total=total_files, desc="Testing Merges", unit="file") as pbar:
-                for i in range(0, total_files, CONFIG["BATCH_SIZE"]):
-                    batch = locations_to_test[i:i + CONFIG["BATCH_SIZE"]]
-                    stats = process_test_batch(batch, conflict_logger, conflict_fp, merged_fp, export_merge_pipeline)
+                for batch in batches:
+                    sources_by_media_file = load_metadata_sources(db, {loc.media_file_id for loc in batch})
+                    stats = process_test_batch(batch, sources_by_media_file, conflict_logger, conflict_fp, merged_fp,
+                                               export_merge_pipeline)
 
                     total_stats["scanned"] += stats["scanned"]
                     total_stats["conflicts"] += stats["conflicts"]
                     total_stats["merged"] += stats["merged"]
 
+                    pbar.set_postfix(scanned=total_stats['scanned'], conflicts=total_stats['conflicts'], merged=total_stats['merged'],
+                                     refresh=False)
                     pbar.update(len(batch))
-                    pbar.set_postfix(scanned=total_stats['scanned'], conflicts=total_stats['conflicts'], merged=total_stats['merged'])
     finally:
         print("\n--- Merge Test Complete ---")
         print(f"✅ Scanned {total_stats['scanned']} files.")
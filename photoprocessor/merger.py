@@ -16,13 +16,22 @@ class MergeContext:
     """Holds the state for a single media file's metadata merge process."""
     def __init__(self, sources: List[models.MetadataSource]):
         self.entries: List[models.MetadataEntry] = [entry for src in sources for entry in src.entries]
+        # Entries grouped by key (in their original order), so a step looking up a key does
+        # not scan every entry of the file
+        self.entries_by_key: Dict[str, List[models.MetadataEntry]] = {}
+        for entry in self.entries:
+            self.entries_by_key.setdefault(entry.key, []).append(entry)
         self.merged_data: Dict[str, ExportArgument] = {}
         self.conflicts: Dict[str, List[str]] = {}
         self.finalized_fields: Set[str] = set()
 
     def get_entries_by_keys(self, key: list[str]) -> List[models.MetadataEntry]:
         """Returns all MetadataEntry objects with the specified keys."""
-        return [e for e in self.entries if e.key in key]
+        if len(key) == 1:
+            return list(self.entries_by_key.get(key[0], ()))
+        # Several keys: keep the entries' original order across keys
+        keys = set(key)
+        return [e for e in self.entries if e.key in keys]
 
     def get_value(self, field_name: str, required: bool = False) -> Any:
         """
@@ -110,10 +119,9 @@ class BasicFieldMergeStep(MergeStep):
         # Filter sources by the key we are interested in
         relevant_entries = context.get_entries_by_keys([self.key])
 
-        # COALESCE the typed value columns to get the actual value
-        potential_values = {
-            s.value_str or s.value_dt or s.value_real for s in relevant_entries
-        }
+        # COALESCE the typed value columns to get the actual value (once per entry)
+        entry_values = [(s, s.value_str or s.value_dt or s.value_real) for s in relevant_entries]
+        potential_values = {value for _, value in entry_values}
         potential_values.discard(None)  # Remove None if it exists
 
         if not potential_values:
@@ -125,7 +133,7 @@ class BasicFieldMergeStep(MergeStep):
             else:
                 context.set_value(self.key, potential_values.pop())
         else:
-            context.record_conflict(self.key, f"Conflicting values: {sorted(list(potential_values), key=str)}. Entry IDs: {[s.id for s in relevant_entries if (s.value_str or s.value_dt or s.value_real) in potential_values]}")
+            context.record_conflict(self.key, f"Conflicting values: {sorted(list(potential_values), key=str)}. Entry IDs: {[s.id for s, value in entry_values if value in potential_values]}")
 
 class GPSDateTimeMergeStep(MergeStep):
     def process(self, context: MergeContext):
@@ -502,9 +510,14 @@ class DateTimeAndZoneMergeStep(MergeStep):
 
         container = DateTimeCandidateContainer(tolerance=timedelta(seconds=60))
 
+        # The same file name usually appears once per location and source, so each
+        # distinct name is only run through the date patterns once
+        detected_dates: Dict[str, datetime | None] = {}
         for entry in file_name_entries:
             if entry.value_str:
-                detected_date = self._detect_date_from_file_name(entry.value_str)
+                if entry.value_str not in detected_dates:
+                    detected_dates[entry.value_str] = self._detect_date_from_file_name(entry.value_str)
+                detected_date = detected_dates[entry.value_str]
                 if detected_date:
                     # Create a candidate from the detected naive date.
                     candidate = DateTimeCandidate(
@@ -522,16 +535,15 @@ class DateTimeAndZoneMergeStep(MergeStep):
         # return entries with value_dt set
         return container.candidates
 
-    def _get_candidate(self, key: str|tuple[str,str], entries: List[models.MetadataEntry]) -> DateTimeCandidate | None:
+    def _get_candidate(self, key: str|tuple[str,str], entries_by_key: Dict[str, List[models.MetadataEntry]]) -> DateTimeCandidate | None:
 
-        def _get_value_from_key_and_entries(key: str, entries: List[models.MetadataEntry]) -> Any:
-            for ent in entries:
-                if ent.key == key:
-                    return ent.value
+        def _get_value_from_key_and_entries(key: str) -> Any:
+            for ent in entries_by_key.get(key, ()):
+                return ent.value
 
         if isinstance(key, str):
-            for e in entries:
-                if e.key == key and e.value_dt is not None:
+            for e in entries_by_key.get(key, ()):
+                if e.value_dt is not None:
                     if e.value_dt.tzinfo is not None or e.key not in self.UTC_KEYS:
                         return DateTimeCandidate.from_entry(e)
                     else:
@@ -546,8 +558,8 @@ class DateTimeAndZoneMergeStep(MergeStep):
         elif isinstance(key, tuple) and len(key) == 2:
             first_key, second_key = key
 
-            first_value = _get_value_from_key_and_entries(first_key, entries)
-            second_value = _get_value_from_key_and_entries(second_key, entries)
+            first_value = _get_value_from_key_and_entries(first_key)
+            second_value = _get_value_from_key_and_entries(second_key)
 
             # if first_value and second_value are not none
             if first_value and second_value:
@@ -564,16 +576,16 @@ class DateTimeAndZoneMergeStep(MergeStep):
                         return DateTimeCandidate(
                             representative_value=date,
                             source_keys={key},
-                            source_ids={e.id for e in entries if e.key in key}
+                            source_ids={e.id for k in key for e in entries_by_key.get(k, ())}
                         )
 
         return None
 
-    def _get_candidate_container(self, keys: List[str|tuple[str,str]], entries: List[models.MetadataEntry]) -> DateTimeCandidateContainer:
+    def _get_candidate_container(self, keys: List[str|tuple[str,str]], entries_by_key: Dict[str, List[models.MetadataEntry]]) -> DateTimeCandidateContainer:
         container = DateTimeCandidateContainer(tolerance=timedelta(seconds=20))
 
         for key in keys:
-            candidate = self._get_candidate(key, entries)
+            candidate = self._get_candidate(key, entries_by_key)
             if candidate:
                 container.add_candidate(candidate)
 
@@ -624,7 +636,7 @@ class DateTimeAndZoneMergeStep(MergeStep):
 
     def process(self, context: MergeContext):
         # STEP 1: Gather all datetime candidates from metadata entries
-        candidate_container = self._get_candidate_container(self._get_metadata_keys(), context.entries)
+        candidate_container = self._get_candidate_container(self._get_metadata_keys(), context.entries_by_key)
 
         self._pre_resolve_google_xmp_utc_heuristic(candidate_container)
 
@@ -1,6 +1,7 @@
-from sqlalchemy import Column, Integer, String, REAL, DateTime, ForeignKey, JSON, Boolean, UniqueConstraint
+from sqlalchemy import Column, Integer, String, REAL, DateTime, ForeignKey, JSON, Boolean, UniqueConstraint, Index, func, literal_column, inspect
 from sqlalchemy.orm import relationship
-from photoprocessor.database import Base  # Import Base from your database module
+from sqlalchemy.schema import CreateIndex
+from photoprocessor.database import Base, engine  # Import Base from your database module
 from sqlalchemy.types import TypeDecorator
 import datetime
 from itertools import chain
@@ -91,8 +92,9 @@ class Location(Base):
     filename = Column(String, nullable=False)
     file_size = Column(Integer, nullable=False)
 
-    # A location is an instance of ONE media file's content
-    media_file_id = Column(Integer, ForeignKey('media_files.id'), nullable=False)
+    # A location is an instance of ONE media file's content. Indexed because the export
+    # loads all locations of a set of media files (the copy source candidates).
+    media_file_id = Column(Integer, ForeignKey('media_files.id'), nullable=False, index=True)
     media_file = relationship("MediaFile", back_populates="locations")
 
     # A location can be owned by many people (though typically one)
@@ -102,6 +104,16 @@ class Location(Base):
     metadata_sources = relationship("MetadataSource", back_populates="location", cascade="all, delete-orphan")
 
 
+# The directory part of Location.path, including its trailing separator (filename is the
+# path's basename). It is indexed as an expression so "files directly in folder X" is an
+# equality lookup; queries must use this exact expression (the literal 1 keeps it free
+# of bound parameters) for SQLite to match it against the index.
+LOCATION_PARENT_DIR = func.substr(
+    Location.path, literal_column("1"), func.length(Location.path) - func.length(Location.filename)
+)
+Index('ix_locations_parent_dir', LOCATION_PARENT_DIR)
+
+
 class MediaFile(Base):
     """
     Represents a unique piece of media content, identified by its hash.
@@ -134,6 +146,9 @@ class MediaOwnership(Base):
     __tablename__ = 'media_ownership'
     __table_args__ = (
         UniqueConstraint('owner_id', 'location_id', name='uq_owner_location'),
+        # Lookups by location (path-prefix queries joined from Location, deletes by
+        # location_id); uq_owner_location only serves lookups that start from the owner.
+        Index('ix_media_ownership_location_owner', 'location_id', 'owner_id'),
     )
     id = Column(Integer, primary_key=True, index=True)
     owner_id = Column(Integer, ForeignKey('owners.id'), nullable=False)
@@ -188,3 +203,19 @@ class MetadataEntry(Base):
         if self.value_real is not None:
             return self.value_real
         return None
+
+
+def ensure_indexes(bind=engine):
+    """
+    Creates the model indexes that are missing from an existing database.
+    create_all() skips tables that already exist, so indexes added to the models later
+    would otherwise never be created. Every entry point that queries the database calls this.
+    """
+    # IF NOT EXISTS is used because index reflection (checkfirst) skips expression indexes.
+    with bind.begin() as conn:
+        existing_tables = set(inspect(conn).get_table_names())
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            for index in table.indexes:
+                conn.execute(CreateIndex(index, if_not_exists=True))
@@ -252,7 +252,9 @@ class PhotoProcessor:
                 argfile_path = argfile.name
 
             final_command = ["exiftool", "-@", argfile_path]
-            result = subprocess.run(final_command, check=True, capture_output=True, text=True)
+            # Binary pipes: json.loads decodes ExifTool's UTF-8 output itself, independent of
+            # the locale encoding, and stderr is only decoded when something failed
+            result = subprocess.run(final_command, check=True, capture_output=True)
             return json.loads(result.stdout), []  # Success, no failures
 
         except FileNotFoundError:
@@ -273,11 +275,12 @@ class PhotoProcessor:
             for path in filepaths:
                 try:
                     final_individual_args = individual_args_base + [path]
-                    result = subprocess.run(final_individual_args, check=True, capture_output=True, text=True)
+                    result = subprocess.run(final_individual_args, check=True, capture_output=True)
                     data = json.loads(result.stdout)
                     results.append(data[0] if data else {})
                 except (subprocess.CalledProcessError, json.JSONDecodeError) as individual_e:
-                    stderr = getattr(individual_e, 'stderr', '').strip() or str(individual_e)
+                    stderr = (getattr(individual_e, 'stderr', None) or b'').decode('utf-8', errors='replace')
+                    stderr = stderr.strip() or str(individual_e)
                     error_msg = f"Exiftool individual processing failed. Error: {stderr}"
                     print(f"  - Failed to process: {os.path.basename(path)}. {error_msg}")
                     # Add a placeholder to results so indices match, and log the failure.